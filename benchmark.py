@@ -0,0 +1,334 @@
+"""Benchmark the conversion hot path on a synthetic image corpus.
+
+Generates images locally (no downloads), times decode, resize, mode conversion
+and encode separately for every target format / quality / max_width preset,
+and writes the results as JSON so two runs can be compared automatically.
+Each encoder profile is also run once per format and quality, and the report
+lists its speed and output size relative to Pillow's default settings.
+
+Usage:
+    python benchmark.py --output bench.json
+    python benchmark.py --quick --compare bench.json   # exits 1 on a regression
+"""
+from PIL import Image, ImageDraw
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import PIL
+
+from cli import ENCODER_PROFILES, ConversionPipeline, _StageClock, batch_convert_images
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCHMARK_VERSION = 1
+
+# (width, height) of the generated sources
+CORPUS_SIZES = [(640, 480), (1920, 1080), (4000, 3000)]
+CORPUS_MODES = ["RGB", "RGBA", "P"]
+CORPUS_FORMATS = ["png", "jpeg", "webp"]
+
+QUICK_SIZES = [(640, 480), (1920, 1080)]
+
+
+def generate_corpus(folder, sizes=None, modes=None, formats=None, copies=1):
+    """Write a synthetic corpus of every size x mode x format combination.
+
+    Images are a gradient with noise and a few shapes, so encoders see
+    something closer to a photo than a flat color.
+
+    Args:
+        folder: Output folder (created if needed)
+        sizes: List of (width, height) tuples (default CORPUS_SIZES)
+        modes: Image modes to generate (default RGB, RGBA, P)
+        formats: Source formats to save as (default png, jpeg, webp)
+        copies: Images per combination (default 1)
+
+    Returns:
+        List of dicts describing each generated file (path, format, mode, size, bytes)
+    """
+    os.makedirs(folder, exist_ok=True)
+    corpus = []
+    for width, height in sizes or CORPUS_SIZES:
+        base = _synthetic_image(width, height)
+        for mode in modes or CORPUS_MODES:
+            img = _to_mode(base, mode)
+            for fmt in formats or CORPUS_FORMATS:
+                # JPEG has no alpha or palette; save what a camera would produce
+                source = img.convert("RGB") if fmt == "jpeg" and mode != "RGB" else img
+                for copy in range(copies):
+                    path = os.path.join(folder, f"{width}x{height}_{mode}_{copy}.{fmt}")
+                    source.save(path, fmt.upper())
+                    corpus.append({"path": path, "format": fmt, "mode": source.mode,
+                                   "size": [width, height], "bytes": os.path.getsize(path)})
+    return corpus
+
+
+def benchmark_case(corpus, output_format, quality=85, max_width=None, resize_mode="exact", repeat=1, profile=None):
+    """Time every stage of converting the whole corpus with one set of options.
+
+    Runs in the calling process; use `run_cases` to give each case a fresh
+    process so the peak memory figure belongs to that case alone.
+
+    Returns:
+        Dict with throughput, latency percentiles, per-stage totals and peak memory
+    """
+    stages = {"decode": 0.0, "resize": 0.0, "convert": 0.0, "encode": 0.0}
+    latencies = []
+    input_bytes = 0
+    output_bytes = 0
+    # The same pipeline every front end converts through, timed by its own stage clock
+    pipeline = ConversionPipeline(output_format, max_width, quality, resize_mode=resize_mode, profile=profile)
+
+    for _ in range(repeat):
+        for item in corpus:
+            clock = _StageClock(item["path"])
+            buffer = io.BytesIO()
+            pipeline.convert_stream(item["path"], buffer, clock)
+
+            for stage, seconds in clock.stages.items():
+                stages[stage] = stages.get(stage, 0.0) + seconds
+            latencies.append(clock.last - clock.started)
+            input_bytes += item["bytes"]
+            output_bytes += buffer.tell()
+
+    total_time = sum(latencies)
+    return {
+        "format": output_format.lower(),
+        "quality": quality,
+        "max_width": max_width,
+        "resize_mode": resize_mode,
+        "profile": profile,
+        "images": len(latencies),
+        "seconds": round(total_time, 6),
+        "images_per_sec": round(len(latencies) / total_time, 3) if total_time else None,
+        "mb_per_sec": round(input_bytes / 1e6 / total_time, 3) if total_time else None,
+        "latency_ms": {
+            "p50": round(_percentile(latencies, 50) * 1000, 3),
+            "p99": round(_percentile(latencies, 99) * 1000, 3),
+        },
+        "stages_ms": {stage: round(seconds * 1000, 3) for stage, seconds in stages.items()},
+        "input_bytes": input_bytes,
+        "output_bytes": output_bytes,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def run_cases(corpus, formats, qualities, widths, resize_modes=("exact",), repeat=1, profiles=()):
+    """Run every format x quality x width x resize mode case, each in a fresh process.
+
+    Encoder profiles only change the encode, so each one runs at the first
+    width (exact resize) for every format and quality, not the whole matrix.
+    """
+    cases = []
+    for output_format in formats:
+        # Quality is ignored by lossless encoders, so one run per width is enough
+        format_qualities = qualities if output_format.lower() in ['jpg', 'jpeg', 'webp'] else qualities[:1]
+        for quality in format_qualities:
+            runs = [(max_width, resize_mode, None) for max_width in widths
+                    for resize_mode in (resize_modes if max_width else ("exact",))]
+            runs += [(widths[0], "exact", profile) for profile in profiles]
+            for max_width, resize_mode, profile in runs:
+                with ProcessPoolExecutor(max_workers=1) as executor:
+                    case = executor.submit(benchmark_case, corpus, output_format, quality, max_width,
+                                           resize_mode, repeat, profile).result()
+                cases.append(case)
+                profile_info = f" {profile}" if profile else ""
+                print(f"⏱ {output_format.upper()} Q:{quality} width:{max_width or 'original'} {resize_mode}{profile_info}: "
+                      f"{case['images_per_sec']} img/s, p99 {case['latency_ms']['p99']} ms", file=sys.stderr)
+    return cases
+
+
+def profile_tradeoffs(cases):
+    """Compare every encoder profile case with the default-settings case of the same options.
+
+    Returns:
+        List of dicts with the profile's throughput and output size as ratios
+        of the default encoder settings (speed > 1 is faster, size < 1 smaller)
+    """
+    def key(case):
+        return (case["format"], case["quality"], case["max_width"], case.get("resize_mode", "exact"))
+
+    defaults = {key(case): case for case in cases if not case.get("profile")}
+    tradeoffs = []
+    for case in cases:
+        default = defaults.get(key(case))
+        if not case.get("profile") or not default or not default["images_per_sec"] or not default["output_bytes"]:
+            continue
+        tradeoffs.append({"format": case["format"], "quality": case["quality"], "max_width": case["max_width"],
+                          "profile": case["profile"],
+                          "speed": round(case["images_per_sec"] / default["images_per_sec"], 3),
+                          "size": round(case["output_bytes"] / default["output_bytes"], 3)})
+        print(f"🗜️ {case['format'].upper()} Q:{case['quality']} {case['profile']}: "
+              f"{tradeoffs[-1]['speed']:.2f}x speed, {tradeoffs[-1]['size']:.1%} of default size", file=sys.stderr)
+    return tradeoffs
+
+
+def benchmark_batch(folder, output_format, workers_list, quality=85, max_width=None):
+    """Time `batch_convert_images` end to end for each worker count."""
+    runs = []
+    for workers in workers_list:
+        output_folder = tempfile.mkdtemp(prefix="pixelforge-bench-out-")
+        try:
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                success, failed = batch_convert_images(folder, output_format, max_width=max_width, quality=quality,
+                                                       output_folder=output_folder, workers=workers)
+            seconds = time.perf_counter() - started
+        finally:
+            shutil.rmtree(output_folder, ignore_errors=True)
+        runs.append({"format": output_format.lower(), "quality": quality, "max_width": max_width,
+                     "workers": workers or os.cpu_count(), "images": success + failed, "failed": failed,
+                     "seconds": round(seconds, 6),
+                     "images_per_sec": round((success + failed) / seconds, 3) if seconds else None})
+        print(f"⏱ batch {output_format.upper()} x{workers or os.cpu_count()} workers: "
+              f"{runs[-1]['images_per_sec']} img/s", file=sys.stderr)
+    return runs
+
+
+def compare_reports(baseline, current, threshold=0.10):
+    """List cases whose throughput dropped by more than `threshold` versus a baseline report.
+
+    Returns:
+        List of human-readable regression descriptions (empty when none)
+    """
+    def key(case):
+        return (case["format"], case["quality"], case["max_width"], case.get("resize_mode", "exact"),
+                case.get("profile"))
+
+    baseline_cases = {key(case): case for case in baseline.get("cases", [])}
+    regressions = []
+    for case in current.get("cases", []):
+        old = baseline_cases.get(key(case))
+        if not old or not old["images_per_sec"] or not case["images_per_sec"]:
+            continue
+        change = case["images_per_sec"] / old["images_per_sec"] - 1
+        if change < -threshold:
+            regressions.append(f"{case['format'].upper()} Q:{case['quality']} width:{case['max_width'] or 'original'} "
+                               f"{case.get('resize_mode', 'exact')} {case.get('profile') or 'default'}: "
+                               f"{old['images_per_sec']} → "
+                               f"{case['images_per_sec']} img/s ({change:+.1%})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark PixelForge conversions on a synthetic corpus.")
+    parser.add_argument("--formats", nargs="+", default=["webp", "jpeg", "png"], help="Target formats")
+    parser.add_argument("--qualities", nargs="+", type=int, default=[75, 85, 95], help="JPEG/WebP qualities")
+    parser.add_argument("--widths", nargs="+", default=["none", "640", "1080", "1920"],
+                        help="max_width presets ('none' = no resize)")
+    parser.add_argument("--resize-modes", nargs="+", default=["exact", "fast"], help="Resize modes to compare")
+    parser.add_argument("--profiles", nargs="*", choices=list(ENCODER_PROFILES), default=list(ENCODER_PROFILES),
+                        help="Encoder profiles to compare with the default settings (empty = skip)")
+    parser.add_argument("--copies", type=int, default=1, help="Images per size/mode/format combination")
+    parser.add_argument("--repeat", type=int, default=1, help="Passes over the corpus per case")
+    parser.add_argument("--workers", nargs="*", type=int, default=[1, 0],
+                        help="Worker counts for the end-to-end batch run (0 = one per core, empty = skip)")
+    parser.add_argument("--quick", action="store_true", help="Small corpus and a reduced case matrix")
+    parser.add_argument("--corpus-dir", help="Keep the generated corpus here instead of a temp folder")
+    parser.add_argument("--output", help="Write the JSON report to this file (default: stdout)")
+    parser.add_argument("--compare", help="Baseline JSON report; exit 1 if any case is slower")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed slowdown for --compare (default 0.10)")
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.qualities = args.qualities[:1]
+        args.widths = args.widths[:2]
+    widths = [None if width.lower() in ("none", "0") else int(width) for width in args.widths]
+
+    corpus_dir = args.corpus_dir or tempfile.mkdtemp(prefix="pixelforge-bench-")
+    try:
+        print(f"🖼️ Generating corpus in {corpus_dir}...", file=sys.stderr)
+        corpus = generate_corpus(corpus_dir, QUICK_SIZES if args.quick else CORPUS_SIZES, copies=args.copies)
+
+        report = {
+            "version": BENCHMARK_VERSION,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "environment": {"python": platform.python_version(), "pillow": PIL.__version__,
+                            "platform": platform.platform(), "cpu_count": os.cpu_count()},
+            "corpus": {"images": len(corpus), "bytes": sum(item["bytes"] for item in corpus),
+                       "sizes": sorted({tuple(item["size"]) for item in corpus}),
+                       "modes": CORPUS_MODES, "formats": CORPUS_FORMATS},
+            "cases": run_cases(corpus, args.formats, args.qualities, widths, args.resize_modes, args.repeat,
+                               args.profiles),
+            "batch": [],
+        }
+        report["profiles"] = profile_tradeoffs(report["cases"])
+        if args.workers:
+            report["batch"] = benchmark_batch(corpus_dir, args.formats[0], [workers or None for workers in args.workers],
+                                              args.qualities[0], widths[-1])
+    finally:
+        if not args.corpus_dir:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            regressions = compare_reports(json.load(f), report, args.threshold)
+        for regression in regressions:
+            print(f"✗ Regression: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+def _synthetic_image(width, height):
+    """Build an RGB test image: gradient + noise + shapes."""
+    gradient = Image.linear_gradient("L").resize((width, height))
+    noise = Image.effect_noise((width, height), 48)
+    img = Image.merge("RGB", (gradient, noise, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+
+    draw = ImageDraw.Draw(img)
+    for idx in range(8):
+        box = (width * idx // 10, height * idx // 12, width * (idx + 2) // 10, height * (idx + 3) // 12)
+        draw.ellipse(box, fill=(40 * idx % 256, 255 - 30 * idx, 90))
+    return img
+
+
+def _to_mode(img, mode):
+    """Convert the RGB base image to one of the corpus modes."""
+    if mode == "RGBA":
+        rgba = img.convert("RGBA")
+        rgba.putalpha(Image.linear_gradient("L").resize(img.size))
+        return rgba
+    if mode == "P":
+        return img.quantize(colors=256)
+    return img.convert(mode)
+
+
+def _percentile(values, percent):
+    """Nearest-rank percentile of a list of numbers."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(1, -(-len(ordered) * percent // 100))  # ceil without floats
+    return ordered[int(rank) - 1]
+
+
+def _peak_rss_mb():
+    """Peak resident memory of this process in MB, or None where it cannot be read."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
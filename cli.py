@@ -1,8 +1,108 @@
-from PIL import Image
+from PIL import Image, ImageFilter, ImageMath
+import array
+import argparse
+import asyncio
+import bisect
+import collections
+import contextlib
+import fnmatch
+import functools
+import hashlib
+import io
+import itertools
+import json
+import math
 import os
+import queue
+import re
+import shutil
+import signal
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from pathlib import Path
 
-def convert_image(input_path, output_format, max_width=None, quality=85, output_folder=None):
+try:
+    from PIL import ImageCms  # Color profile conversion, needs Pillow built with LittleCMS
+except ImportError:
+    ImageCms = None
+
+try:
+    import fcntl  # Reflinks (copy-on-write clones) for deduplicated outputs, POSIX only
+except ImportError:
+    fcntl = None
+
+try:
+    from watchdog.observers import Observer  # Filesystem events (inotify, FSEvents, ...) for watch_folder
+except ImportError:
+    Observer = None
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.ico', '.gif', '.tiff'}
+RESIZE_MODES = ("exact", "fast")
+CACHE_CHECKS = ("mtime", "hash")
+MANIFEST_VERSION = 1
+PROBE_INDEX_VERSION = 1
+JOURNAL_VERSION = 1
+
+# Bytes Pillow allocates per pixel; multi-band 8-bit modes are stored as 4 bytes
+_BYTES_PER_PIXEL = {"1": 1, "L": 1, "P": 1, "I;16": 2, "I;16B": 2, "I;16L": 2, "I": 4, "F": 4}
+
+# Exit codes of `main`; argparse itself also exits with 2 on bad arguments
+EXIT_OK = 0  # Everything converted or up to date
+EXIT_FAILED = 1  # At least one file failed
+EXIT_USAGE = 2  # Bad arguments or job file
+EXIT_NO_IMAGES = 3  # No image matched any input
+EXIT_INTERRUPTED = 130
+
+# Keys a --job file entry may set; anything else is rejected so typos do not pass silently
+JOB_KEYS = ("input", "format", "max_width", "quality", "output_folder", "pattern", "recursive", "include", "exclude",
+            "resize_mode", "manifest", "cache_check", "targets", "memory_budget", "workers", "chunk_size", "count", "dedup", "srgb", "sharpen", "strip_metadata",
+            "max_bytes", "min_ssim", "profile", "preflight", "probe_index", "journal")
+
+LOSSY_FORMATS = ('jpg', 'jpeg', 'webp')  # Formats whose quality setting a size/SSIM target can search
+SEQUENTIAL_FORMATS = ("JPEG", "PNG", "WEBP", "GIF", "BMP")  # Pillow writers that never seek, so any sink will do
+MULTI_FRAME_FORMATS = ("GIF", "WEBP", "TIFF")  # Animation/multi-page formats, read and written with every frame
+_SSIM_SIZE = 512  # Longest side both images are reduced to before SSIM is measured
+_SSIM_BLOCK = 8  # SSIM window size in pixels
+
+# Encoder settings per profile, keyed by Pillow format; formats not listed keep Pillow's defaults
+ENCODER_PROFILES = {
+    "fastest": {
+        "JPEG": {"optimize": False, "progressive": False, "subsampling": "4:2:0"},
+        "WEBP": {"method": 0},
+        "PNG": {"compress_level": 1},
+    },
+    "balanced": {
+        "JPEG": {"optimize": True, "progressive": False},
+        "WEBP": {"method": 4},
+        "PNG": {"compress_level": 6},
+    },
+    "smallest": {
+        "JPEG": {"optimize": True, "progressive": True, "subsampling": "4:2:0"},
+        "WEBP": {"method": 6},
+        "PNG": {"compress_level": 9, "optimize": True},
+    },
+}
+
+_FICLONE = 0x40049409  # Linux ioctl cloning a file's extents (Btrfs, XFS, ...)
+_PARTIAL_HASH_BYTES = 64 * 1024  # Read from each end of a file before hashing all of it
+_EXIF_ORIENTATION = 0x0112
+_PROBE_FIELDS = ("format", "width", "height", "mode", "frames", "orientation", "error")
+
+PREVIEW_SIZE = 480  # Longest side of the downscaled copies PreviewCache keeps
+PREVIEW_CACHE_SIZE = 8  # Downscaled copies PreviewCache keeps
+
+WATCH_POLL_SECONDS = 1.0  # How often watch_folder rescans a folder when it has no filesystem events
+WATCH_SETTLE_SECONDS = 1.0  # How long a file's size and mtime must stay put before watch_folder converts it
+
+_async_pool = None  # Shared ProcessPoolExecutor of the async API, see _async_executor
+
+
+def convert_image(input_path, output_format, max_width=None, quality=85, output_folder=None, resize_mode="exact",
+                  metrics=None, max_bytes=None, min_ssim=None, profile=None):
     """Convert a single image to the specified format.
     
     Args:
@@ -11,46 +111,112 @@ def convert_image(input_path, output_format, max_width=None, quality=85, output_
         max_width: Maximum width for resizing (optional, in pixels)
         quality: Quality for JPEG/WebP (1-100, default 85)
         output_folder: Output folder path (optional, defaults to same as input)
+        resize_mode: "exact" (full decode + LANCZOS) or "fast" (draft decode + reducing_gap)
+        metrics: Callable given the per-file stage timings and sizes, e.g. a BatchMetrics (optional)
+        max_bytes: Search the highest JPEG/WebP quality whose output fits in this many bytes (optional)
+        min_ssim: Search the lowest JPEG/WebP quality whose SSIM reaches this value, e.g. 0.98 (optional)
+        profile: Encoder profile, "fastest", "balanced" or "smallest" (optional, default Pillow's settings)
     """
-    try:
-        # Open the image file
-        with Image.open(input_path) as img:
-            # Resize if needed
-            if max_width and isinstance(max_width, int):
-                img = _resize_image(img, max_width)
-            
-            # Determine output path
-            file_name, _ = os.path.splitext(input_path)
-            base_name = os.path.basename(file_name)
-            
-            if output_folder:
-                output_path = os.path.join(output_folder, f"{base_name}_converted.{output_format.lower()}")
-            else:
-                output_path = f"{file_name}_converted.{output_format.lower()}"
-            
-            # Convert specifically for RGB modes if saving to JPEG (which doesn't support transparency)
-            if output_format.lower() in ['jpg', 'jpeg'] and img.mode in ('RGBA', 'P'):
-                img = img.convert('RGB')
-            
-            # Save with quality for JPEG/WebP
-            save_kwargs = {}
-            if output_format.lower() in ['jpg', 'jpeg', 'webp']:
-                save_kwargs['quality'] = min(100, max(1, quality))  # Clamp quality to 1-100
-            
-            img.save(output_path, output_format.upper(), **save_kwargs)
-            size_info = f" ({img.width}x{img.height})" if max_width else ""
-            quality_info = f" [Q:{quality}]" if output_format.lower() in ['jpg', 'jpeg', 'webp'] else ""
-            print(f"✓ Converted: {os.path.basename(input_path)} → {os.path.basename(output_path)}{size_info}{quality_info}")
-            return True
-            
-    except Exception as e:
-        print(f"✗ Error converting {input_path}: {e}")
-        return False
+    pipeline = ConversionPipeline(output_format, max_width, quality, output_folder, resize_mode,
+                                  max_bytes=max_bytes, min_ssim=min_ssim, profile=profile)
+    result = pipeline.convert(input_path, collect_metrics=metrics is not None)
+    if metrics is not None:
+        metrics(result["metrics"])
+    _print_result(result, output_format, max_width, quality)
+    return result["status"] == "converted"
+
+
+def convert_image_variants(input_path, targets, output_folder=None, resize_mode="exact", metrics=None, profile=None):
+    """Convert one image to several formats/sizes, decoding it only once.
+    
+    Each smaller size is resized from the next larger one instead of from the
+    original, and every variant is written as `<name>_<width>w_converted.<fmt>`
+    (or `<name>_converted.<fmt>` when it keeps the original width).
+    
+    Args:
+        input_path: Path to the image file
+        targets: List of output specs: dicts with format/width/quality keys,
+            (format, width, quality) tuples, or plain format strings
+        output_folder: Output folder path (optional, defaults to same as input)
+        resize_mode: "exact" (full decode + LANCZOS) or "fast" (draft decode + reducing_gap)
+        metrics: Callable given the per-file stage timings and sizes, e.g. a BatchMetrics (optional)
+        profile: Encoder profile, "fastest", "balanced" or "smallest" (optional, default Pillow's settings)
+    """
+    pipeline = ConversionPipeline(output_folder=output_folder, resize_mode=resize_mode, targets=targets,
+                                  profile=profile)
+    result = pipeline.convert(input_path, collect_metrics=metrics is not None)
+    if metrics is not None:
+        metrics(result["metrics"])
+    _print_result(result, None)
+    return result["status"] == "converted"
 
 
-def batch_convert_images(folder_path, output_format, file_pattern="*", max_width=None, quality=85, output_folder=None):
+def convert_image_bytes(source, output_format, max_width=None, quality=85, resize_mode="exact", out=None,
+                        profile=None):
+    """Convert an in-memory image without touching the filesystem.
+    
+    bytes input is read in place and bytearray/memoryview input through a
+    view, so the source is never copied up front. Output is encoded straight
+    into `out` when it is a file object, which need not be seekable (pipes,
+    sockets and response bodies work); formats whose writer seeks (TIFF, ICO)
+    are encoded in memory first. A writable buffer receives a single copy of
+    the encoded bytes. Errors are raised, nothing is printed.
+    
+    Args:
+        source: Encoded image as bytes, bytearray, memoryview or a readable binary file object
+        output_format: Target format (png, jpg, jpeg, webp, bmp, ico)
+        max_width: Maximum width for resizing (optional, in pixels)
+        quality: Quality for JPEG/WebP (1-100, default 85)
+        resize_mode: "exact" (full decode + LANCZOS) or "fast" (draft decode + reducing_gap)
+        out: Writable binary file object or writable buffer (bytearray, memoryview) (optional)
+        profile: Encoder profile, "fastest", "balanced" or "smallest" (optional, default Pillow's settings)
+    
+    Returns:
+        The encoded bytes when out is None, otherwise the number of bytes written to out
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)  # Shares the bytes object, no copy
+    elif isinstance(source, (bytearray, memoryview)):
+        source = _MemoryReader(source)
+    
+    pipeline = ConversionPipeline(output_format, max_width, quality, resize_mode=resize_mode, profile=profile)
+    if out is not None and hasattr(out, "write") and pipeline.outputs[0][1] in SEQUENTIAL_FORMATS:
+        # Counted as written rather than by tell(), which pipes, sockets and response bodies do not support
+        writer = _CountingWriter(out)
+        pipeline.convert_stream(source, writer)
+        return writer.written
+    
+    buffer = io.BytesIO()
+    pipeline.convert_stream(source, buffer)
+    if out is None:
+        return buffer.getvalue()
+    if hasattr(out, "write"):
+        out.write(buffer.getbuffer())  # Encoded with seeks, so into memory first
+        return buffer.tell()
+    
+    view = memoryview(out).cast("B")
+    size = buffer.tell()
+    if size > len(view):
+        raise ValueError(f"Output buffer too small: {size} bytes needed, {len(view)} available")
+    view[:size] = buffer.getbuffer()[:size]
+    return size
+
+
+def batch_convert_images(folder_path, output_format, file_pattern="*", max_width=None, quality=85, output_folder=None,
+                         workers=1, chunk_size=8, return_results=False, resize_mode="exact", manifest_path=None,
+                         cache_check="mtime", targets=None, recursive=False, include=None, exclude=None,
+                         show_total=True, metrics=None, memory_budget=None, on_result=None, verbose=True,
+                         dedup=False, stages=(), max_bytes=None, min_ssim=None, profile=None, preflight=False,
+                         probe_index_path=None, journal_path=None):
     """Convert multiple images in a folder to the specified format.
     
+    Outputs are written to a temp file and renamed into place, so a run that
+    is killed never leaves a truncated one. With a journal, an interrupted
+    run of the same job resumes from it (see `BatchJournal`): files finished
+    before are skipped without being opened, and when the scan had completed
+    the folder is not scanned again. The journal is deleted once the batch
+    runs to the end.
+    
     Args:
         folder_path: Path to folder containing images
         output_format: Target format (png, jpg, jpeg, webp, bmp, ico)
@@ -58,48 +224,2268 @@ def batch_convert_images(folder_path, output_format, file_pattern="*", max_width
         max_width: Maximum width for resizing (optional, in pixels)
         quality: Quality for JPEG/WebP (1-100, default 85)
         output_folder: Output folder path (optional, defaults to same folder)
+        workers: Number of worker processes (default 1 = in-process, None = one per CPU core)
+        chunk_size: Files handed to a worker process at a time (default 8)
+        return_results: Also return the per-file result list (default False)
+        resize_mode: "exact" (full decode + LANCZOS) or "fast" (draft decode + reducing_gap)
+        manifest_path: JSON manifest of completed conversions; up-to-date outputs are skipped (optional)
+        cache_check: "mtime" (size + mtime) or "hash" (also compare a content hash on mtime change)
+        targets: Output specs to fan each image out to (see `convert_image_variants`);
+            output_format, max_width and quality become defaults for specs that omit them
+        recursive: Also convert images in subfolders, mirroring them under output_folder (default False)
+        include: Wildcard patterns a file's relative path or name must match (optional)
+        exclude: Wildcard patterns for files and folders to skip (optional)
+        show_total: Count the files first so progress shows [n/total] (default True);
+            with False conversion starts while the folder is still being scanned
+        metrics: Callable given every file's stage timings and sizes, e.g. a BatchMetrics (optional)
+        memory_budget: Cap in bytes on the estimated decoded pixels in flight across workers (optional)
+        on_result: Callable given (result, done, total) as each file finishes (optional)
+        verbose: Print progress and a summary (default True)
+        dedup: Convert byte-identical sources once and link or copy the output (default False)
+        stages: Image callables run after resizing, e.g. strip_metadata (see `ConversionPipeline`)
+        max_bytes: Search the highest JPEG/WebP quality whose output fits in this many bytes (optional)
+        min_ssim: Search the lowest JPEG/WebP quality whose SSIM reaches this value, e.g. 0.98 (optional);
+            with a manifest, each file's chosen quality is the first guess on the next run
+        profile: Encoder profile, "fastest", "balanced" or "smallest" (optional, default Pillow's settings)
+        preflight: Probe every header before converting: unreadable files fail up front, the largest
+            images go first and progress shows a pixel-weighted ETA (default False)
+        probe_index_path: SQLite file keeping the header probes between runs; implies preflight (optional)
+        journal_path: NDJSON write-ahead journal to resume an interrupted run from (optional)
     
     Returns:
-        Tuple of (successful_count, failed_count)
+        Tuple of (successful_count, failed_count), or
+        (successful_count, failed_count, results) when return_results is True
     """
+    log = print if verbose else _quiet
     folder = Path(folder_path)
     if not folder.is_dir():
-        print(f"Error: {folder_path} is not a valid directory")
-        return (0, 0)
+        log(f"Error: {folder_path} is not a valid directory")
+        return (0, 0, []) if return_results else (0, 0)
     
-    # Find all image files matching the pattern
-    image_extensions = {'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.ico', '.gif', '.tiff'}
-    image_files = [f for f in folder.glob(file_pattern) if f.suffix.lower() in image_extensions]
+    exclude = _exclude_output_folder(folder, output_folder, recursive, exclude)
+    pipeline = ConversionPipeline(output_format, max_width, quality, output_folder, resize_mode, targets,
+                                  source_root=folder if recursive else None, stages=stages, max_bytes=max_bytes,
+                                  min_ssim=min_ssim, profile=profile)
+    journal = None
+    if journal_path:
+        # Outputs land under output_folder (mirroring the folder when recursive), so it is part of the job too
+        output_root = os.path.abspath(output_folder) if output_folder else None
+        journal = BatchJournal(journal_path, folder, [file_pattern, recursive, include, exclude, output_root,
+                                                      pipeline.settings])
     
-    if not image_files:
-        print(f"No image files found in {folder_path}")
-        return (0, 0)
+    # Find image files matching the pattern as the scan goes, counting them first only if asked to
+    def scan():
+        return _skip_own_outputs(iter_image_files(folder, file_pattern, recursive, include, exclude), pipeline)
+    
+    if journal is not None:
+        # The first full pass journals the file list; later passes (and a resumed run) read it back
+        scan = functools.partial(journal.scan, scan())
+    probe_index = ProbeIndex(probe_index_path or ":memory:") if preflight or probe_index_path else None
+    progress = None
+    if probe_index is not None:
+        # The probe pass counts the files too, and leaves their headers in the index for the plan
+        progress = PixelProgress(probe_index, scan())
+        total = progress.files
+    elif journal is not None and journal.scan_done:
+        total = journal.total
+    else:
+        total = count_image_files(scan()) if show_total else None
+    
+    if total == 0:
+        log(f"No image files found in {folder_path}")
+        if probe_index is not None:
+            probe_index.close()
+        if journal is not None:
+            journal.close(complete=True)
+        return (0, 0, []) if return_results else (0, 0)
     
     resize_info = f" (max width: {max_width}px)" if max_width else ""
     quality_info = f" [Q:{quality}]" if output_folder or max_width else ""
+    if max_bytes or min_ssim:
+        quality_info = f" [{_format_quality_target(max_bytes, min_ssim)}]"
+    profile_info = f" ({profile} encoding)" if profile else ""
     output_info = f" → {output_folder}" if output_folder else ""
-    print(f"\nStarting batch conversion of {len(image_files)} image(s) to {output_format.upper()}{resize_info}{quality_info}{output_info}...")
-    print("-" * 60)
+    workers_info = f" using {workers or os.cpu_count()} workers" if workers != 1 else ""
+    if memory_budget:
+        workers_info += f" within {memory_budget / (1 << 20):.0f} MB"
+    if pipeline.variants:
+        formats_info = ", ".join(f"{fmt.upper()}@{width}px" if width else fmt.upper()
+                                 for fmt, width, _ in pipeline.targets)
+        resize_info = quality_info = ""
+    else:
+        formats_info = output_format.upper()
+    count_info = f"{total} image(s)" if total is not None else "images"
+    log(f"\nStarting batch conversion of {count_info} to {formats_info}{resize_info}{quality_info}{profile_info}{output_info}{workers_info}...")
+    if progress is not None:
+        unreadable_info = f", {progress.unreadable} unreadable" if progress.unreadable else ""
+        log(f"🔎 Probed headers: {progress.pixels / 1e6:.1f} MP in total{unreadable_info}, largest first")
+    if journal is not None and journal.resumed:
+        scan_info = "" if journal.scan_done else ", rescanning for the rest"
+        log(f"⏯ Resuming from {journal_path}: {len(journal.done)} file(s) already done{scan_info}")
+    log("-" * 60)
     
     success_count = 0
     failed_count = 0
+    skipped_count = 0
+    links = {}  # materialization method -> number of deduplicated files
+    saved_bytes = 0
+    results = []
+    manifest = load_manifest(manifest_path) if manifest_path else None
     
-    for idx, image_path in enumerate(image_files, 1):
-        print(f"[{idx}/{len(image_files)}] ", end="")
-        if convert_image(str(image_path), output_format, max_width, quality, output_folder):
-            success_count += 1
-        else:
-            failed_count += 1
+    results_iter = iter_convert_images(journal.pending(scan()) if journal else scan(), workers=workers,
+                                       chunk_size=chunk_size, manifest=manifest, cache_check=cache_check,
+                                       metrics=metrics, memory_budget=memory_budget, dedup=dedup, pipeline=pipeline,
+                                       probe_index=probe_index)
+    if journal is not None:
+        results_iter = itertools.chain(journal.replay(manifest), results_iter)
+    idx = 0
+    complete = False
+    try:
+        for idx, result in enumerate(results_iter, 1):
+            if progress is not None:
+                progress.update(result)
+            if verbose:
+                eta_info = f" ETA {_format_duration(progress.eta())}" if progress and progress.eta() else ""
+                print(f"[{idx}/{total}{eta_info}] " if total is not None else f"[{idx}] ", end="")
+                _print_result(result, None if targets else output_format, max_width, quality)
+            if on_result is not None:
+                on_result(result, idx, total)
+            if result.get("link"):
+                links[result["link"]] = links.get(result["link"], 0) + 1
+                saved_bytes += os.path.getsize(result["input"])
+            if result["status"] == "converted":
+                success_count += 1
+            elif result["status"] == "skipped":
+                skipped_count += 1
+            else:
+                failed_count += 1
+            if return_results:
+                results.append(result)
+            if journal is not None:
+                journal.record(result, manifest, pipeline.settings)
+        complete = True
+    finally:
+        # Keep whatever finished, even if the run is interrupted
+        if manifest is not None:
+            evicted = evict_manifest(manifest)
+            save_manifest(manifest_path, manifest)
+        if probe_index is not None:
+            probe_index.close()
+        if journal is not None:
+            journal.close(complete)
     
-    print("-" * 60)
-    print(f"\nBatch conversion complete!")
-    print(f"✓ Successful: {success_count}")
-    print(f"✗ Failed: {failed_count}")
+    if idx == 0:
+        log(f"No image files found in {folder_path}")
+    log("-" * 60)
+    log(f"\nBatch conversion complete!")
+    log(f"✓ Successful: {success_count}")
+    log(f"✗ Failed: {failed_count}")
+    if manifest is not None or journal is not None:
+        log(f"↷ Skipped (up to date): {skipped_count}")
+    if manifest is not None and evicted:
+        log(f"🗑 Evicted {evicted} manifest entr{'y' if evicted == 1 else 'ies'} for deleted sources")
+    if links:
+        methods = ", ".join(f"{count} {'same output' if method == 'same' else method}"
+                            for method, count in sorted(links.items()))
+        log(f"⧉ Deduplicated: {sum(links.values())} identical source(s), {saved_bytes / (1 << 20):.1f} MB "
+            f"not decoded or encoded again ({methods})")
+    if isinstance(metrics, BatchMetrics):
+        log(f"⏱ Stage time: {metrics.format_stages()}")
+    if return_results:
+        return (success_count, failed_count, results)
     return (success_count, failed_count)
 
 
-def _resize_image(img, max_width):
-    """Resize image maintaining aspect ratio."""
+def watch_folder(folder_path, output_format=None, file_pattern="*", max_width=None, quality=85, output_folder=None,
+                 workers=1, recursive=False, include=None, exclude=None, manifest_path=None, cache_check="mtime",
+                 memory_budget=None, pipeline=None, settle_seconds=WATCH_SETTLE_SECONDS, poll_interval=None,
+                 on_result=None, verbose=True, stop_event=None):
+    """Convert images as they land in a folder, until interrupted or stop_event is set.
+    
+    The images already there are converted first (with a manifest, only new
+    or changed ones). After that the folder is watched through filesystem
+    events when the optional watchdog package is installed, so nothing runs
+    while it is quiet; otherwise it is rescanned every poll_interval seconds.
+    A file is converted once its size and mtime have stayed the same for
+    settle_seconds, so files still being copied or uploaded are not picked
+    up half-written. All conversions run on one process pool kept for the
+    whole session, and outputs the session writes are never picked up as
+    new inputs.
+    
+    Args:
+        folder_path: Folder to watch
+        output_format: Target format (png, jpg, jpeg, webp, bmp, ico)
+        file_pattern: Wildcard pattern (default: "*" for all files)
+        max_width: Maximum width for resizing (optional, in pixels)
+        quality: Quality for JPEG/WebP (1-100, default 85)
+        output_folder: Output folder path (optional, defaults to same folder)
+        workers: Number of worker processes (default 1 = in-process, None = one per CPU core)
+        recursive: Also watch subfolders, mirroring them under output_folder (default False)
+        include: Wildcard patterns a file's relative path or name must match (optional)
+        exclude: Wildcard patterns for files and folders to skip (optional)
+        manifest_path: JSON manifest of completed conversions, saved after every batch (optional)
+        cache_check: "mtime" (size + mtime) or "hash" (also compare a content hash on mtime change)
+        memory_budget: Cap in bytes on the estimated decoded pixels in flight across workers (optional)
+        pipeline: A ConversionPipeline to use instead of output_format, max_width, quality and output_folder (optional)
+        settle_seconds: How long a file must stay unchanged before it is converted (default 1.0)
+        poll_interval: Rescan every this many seconds instead of using filesystem events (optional;
+            the default polls every second only when watchdog is not installed)
+        on_result: Callable given (result, done, None) as each file finishes (optional)
+        verbose: Print progress and a summary (default True)
+        stop_event: threading.Event that ends the watch when set (optional; Ctrl+C also stops it)
+    
+    Returns:
+        Tuple of (successful_count, failed_count)
+    """
+    log = print if verbose else _quiet
+    folder = Path(folder_path)
+    if not folder.is_dir():
+        log(f"Error: {folder_path} is not a valid directory")
+        return (0, 0)
+    
+    if pipeline is None:
+        pipeline = ConversionPipeline(output_format, max_width, quality, output_folder,
+                                      source_root=folder if recursive else None)
+    exclude = _exclude_output_folder(folder, pipeline.output_folder, recursive, exclude)
+    filters = (file_pattern, recursive, include, exclude)
+    manifest = load_manifest(manifest_path) if manifest_path else None
+    output_format, max_width, quality = pipeline.targets[0]
+    if workers is None:
+        workers = os.cpu_count() or 1
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    counts = {"converted": 0, "failed": 0}
+    done = 0
+    
+    def convert(image_files):
+        nonlocal done
+        results = iter_convert_images(image_files, workers=workers, manifest=manifest, cache_check=cache_check,
+                                      memory_budget=memory_budget, pipeline=pipeline, executor=executor)
+        for result in results:
+            if result["status"] in counts:
+                counts[result["status"]] += 1
+            done += 1
+            if verbose:
+                _print_result(result, None if pipeline.variants else output_format, max_width, quality)
+            if on_result is not None:
+                on_result(result, done, None)
+        if manifest is not None:
+            save_manifest(manifest_path, manifest)
+    
+    events = queue.Queue()
+    observer = None
+    try:
+        # Catch up on what landed while nobody was watching; events arriving meanwhile wait in the queue
+        if poll_interval is None and Observer is not None:
+            observer = Observer()
+            observer.schedule(_WatchEvents(events), str(folder), recursive=recursive)
+            observer.start()
+        poll_interval = poll_interval or WATCH_POLL_SECONDS
+        image_files = list(iter_image_files(folder, *filters))
+        snapshot = _file_signatures(image_files)
+        convert(list(_skip_own_outputs(image_files, pipeline)))
+        
+        mode_info = "filesystem events" if observer else f"polling every {poll_interval:g}s"
+        log(f"\n👀 Watching {folder_path} ({mode_info}); press Ctrl+C to stop")
+        pending = {}  # path -> (size, mtime_ns) last seen, monotonic time it last changed
+        while not (stop_event and stop_event.is_set()):
+            now = time.monotonic()
+            if pending:
+                timeout = max(0.0, min(since for _, since in pending.values()) + settle_seconds - now)
+            elif observer is None or stop_event:
+                timeout = poll_interval
+            else:
+                timeout = None  # Nothing to do until the next event
+            if observer is None:
+                timeout = min(timeout, poll_interval)
+            
+            paths = []
+            try:
+                paths.append(events.get(timeout=timeout))
+                while True:
+                    paths.append(events.get_nowait())
+            except queue.Empty:
+                pass
+            if observer is None:
+                current = _file_signatures(iter_image_files(folder, *filters))
+                paths.extend(path for path, signature in current.items() if snapshot.get(path) != signature)
+                snapshot = current
+            
+            for path in paths:
+                if os.path.isdir(path):
+                    # A folder moved or copied in as a whole
+                    if recursive:
+                        paths.extend(str(image_path) for image_path in iter_image_files(path))
+                    continue
+                if _is_watched(folder, path, *filters):
+                    pending.setdefault(path, (None, 0.0))
+            
+            ready = []
+            now = time.monotonic()
+            for path, (signature, since) in list(pending.items()):
+                current_signature = _file_signature(path)
+                if current_signature is None:
+                    del pending[path]  # Gone again
+                elif current_signature != signature:
+                    pending[path] = (current_signature, now)  # Still being written
+                elif now - since >= settle_seconds:
+                    ready.append(path)
+                    del pending[path]
+            # Outputs that landed in the watched folder settle like any file, then drop out here
+            ready = list(_skip_own_outputs(ready, pipeline))
+            if ready:
+                convert(ready)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if observer is not None:
+            observer.stop()
+            observer.join()
+        if executor is not None:
+            executor.shutdown()  # iter_convert_images already cancelled anything it left queued
+        if manifest is not None:
+            evict_manifest(manifest)
+            save_manifest(manifest_path, manifest)
+    
+    log(f"\n⏹ Stopped watching {folder_path}: ✓ {counts['converted']} converted, ✗ {counts['failed']} failed")
+    return (counts["converted"], counts["failed"])
+
+
+def iter_convert_images(image_files, output_format=None, max_width=None, quality=85, output_folder=None,
+                        workers=1, chunk_size=8, resize_mode="exact", manifest=None, cache_check="mtime", targets=None,
+                        source_root=None, metrics=None, memory_budget=None, dedup=False, pipeline=None,
+                        max_bytes=None, min_ssim=None, profile=None, probe_index=None, executor=None):
+    """Convert many images, yielding one result per file as soon as it is done.
+    
+    With more than one worker the files are dispatched in chunks to a process
+    pool, so LANCZOS resizes and encodes run on every core. Only a few chunks
+    per worker are in flight at a time, so `image_files` may be any (lazy)
+    iterable. Results arrive in completion order, not input order. Closing the
+    generator early cancels the chunks that have not started yet.
+    
+    When a manifest dict is given, files whose output is still up to date are
+    reported as "skipped" without being converted, and every successful
+    conversion is recorded in it (see `load_manifest`). Files are converted as
+    given, even ones named like an output; folder scans leave the pipeline's
+    own outputs out before they get here (see `_skip_own_outputs`).
+    
+    With a memory budget, each image's decoded size is estimated from its
+    header and work is only admitted while the estimated total in flight stays
+    under the budget. An image that exceeds the budget on its own runs alone.
+    The budget never changes the output: every image is resized in the
+    job's resize mode (only "fast" decodes JPEGs at reduced DCT scale).
+    
+    With dedup, byte-identical sources are converted once: files are compared
+    by size, then by a hash of their first and last 64 KiB, and only then by
+    a full hash. Each copy's output is materialized from the first one's by
+    reflink, hardlink or plain copy, whichever the filesystem allows.
+    
+    With a probe index, every header is probed before the first conversion
+    is queued (so the whole of `image_files` is read up front): files that
+    are not readable images fail right away without a worker attempt, the
+    rest are converted largest first so no big image is left running alone
+    at the end, and the memory budget uses the probed sizes.
+    
+    Args:
+        image_files: Iterable of image paths
+        output_format: Target format (png, jpg, jpeg, webp, bmp, ico)
+        max_width: Maximum width for resizing (optional, in pixels)
+        quality: Quality for JPEG/WebP (1-100, default 85)
+        output_folder: Output folder path (optional, defaults to same folder)
+        workers: Number of worker processes (default 1 = in-process, None = one per CPU core)
+        chunk_size: Files handed to a worker process at a time (default 8)
+        resize_mode: "exact" (full decode + LANCZOS) or "fast" (draft decode + reducing_gap)
+        manifest: Manifest entries dict to check and update (optional)
+        cache_check: "mtime" (size + mtime) or "hash" (also compare a content hash on mtime change)
+        targets: Output specs to fan each image out to (see `convert_image_variants`)
+        source_root: Mirror each file's subfolder of source_root under output_folder (optional)
+        metrics: Callable given every file's stage timings and sizes, e.g. a BatchMetrics (optional)
+        memory_budget: Cap in bytes on the estimated decoded pixels in flight across workers (optional)
+        dedup: Convert byte-identical sources once and link or copy the output (default False)
+        pipeline: A ConversionPipeline to use instead of output_format, max_width, quality,
+            output_folder, resize_mode, targets, source_root, max_bytes, min_ssim and profile (optional)
+        max_bytes: Search the highest JPEG/WebP quality whose output fits in this many bytes (optional)
+        min_ssim: Search the lowest JPEG/WebP quality whose SSIM reaches this value, e.g. 0.98 (optional)
+        profile: Encoder profile, "fastest", "balanced" or "smallest" (optional, default Pillow's settings)
+        probe_index: A ProbeIndex to plan the batch from header probes (optional)
+        executor: ProcessPoolExecutor with `workers` processes to run on instead of starting one;
+            it is left running afterwards (optional)
+    
+    Yields:
+        Result dicts with keys input, output, status ("converted", "skipped"
+        or "failed"), size (output width/height), error and metrics (the
+        per-file stats, or None without a metrics hook). With targets, output
+        and size are lists with one item per variant. Results of deduplicated
+        files also carry duplicate_of (the source converted instead) and link
+        ("reflink", "hardlink" or "copy"). When qualities are searched, results
+        also carry quality (the chosen one; a list with targets, None where
+        fixed) and target_met. A manifest remembers the chosen quality and
+        tries it first on the next run.
+    """
+    if cache_check not in CACHE_CHECKS:
+        raise ValueError(f"cache_check must be one of {CACHE_CHECKS}, got {cache_check!r}")
+    if pipeline is None:
+        pipeline = ConversionPipeline(output_format, max_width, quality, output_folder, resize_mode, targets,
+                                      source_root, max_bytes=max_bytes, min_ssim=min_ssim, profile=profile)
+    
+    collect_metrics = metrics is not None
+    task_args = (collect_metrics, None)
+    output_for = pipeline.output_for
+    if workers is None:
+        workers = os.cpu_count() or 1
+    
+    signatures = {}  # input path -> (manifest key, source signature) taken before converting
+    if manifest is None:
+        planned = (str(path) for path in image_files)
+    else:
+        planned = _skip_up_to_date(image_files, manifest, cache_check, signatures, pipeline.settings, output_for)
+    if probe_index is not None:
+        planned = _preflight(planned, probe_index, pipeline)
+    deduplicator = _Deduplicator(output_for) if dedup else None
+    if deduplicator:
+        planned = deduplicator.plan(planned)
+    
+    def quality_hint(path):
+        # The quality a searched output got last time is the first guess this time
+        if path in signatures and pipeline.searches_quality:
+            return manifest.get(signatures[path][0], {}).get("quality")
+        return None
+    
+    def finish(result):
+        if result["input"] in signatures:
+            key, signature = signatures.pop(result["input"])
+            if result["status"] == "converted":
+                manifest[key] = dict(signature, output=result["output"])
+                if "quality" in result:
+                    manifest[key]["quality"] = result["quality"]
+        if collect_metrics:
+            metrics(result["metrics"] or {"input": result["input"], "status": result["status"]})
+        return result
+    
+    def emit(result):
+        yield finish(result)
+        if deduplicator:
+            # Copies of this source that were held back until its output existed
+            for duplicate in deduplicator.finished(result):
+                yield finish(duplicate)
+    
+    def footprint(path):
+        if probe_index is not None:
+            return _estimate_bytes(probe_index.probe(path), pipeline.decode_width, pipeline.resize_mode)
+        return estimate_footprint(path, pipeline.decode_width, pipeline.resize_mode)
+    
+    if memory_budget:
+        items = ((item, 0 if isinstance(item, dict) else footprint(item)) for item in planned)
+    else:
+        items = ((item, 0) for item in planned)
+    
+    if workers <= 1:
+        for item, _ in items:
+            if isinstance(item, dict):
+                yield from emit(item)
+            else:
+                yield from emit(pipeline.convert(item, *task_args, quality_hint(item)))
+        return
+    
+    # Chunks are kept to a fair share of the budget, so one big image never drags small ones into its slot
+    chunk_budget = memory_budget // workers if memory_budget else None
+    carry = []  # An item pulled from `items` that did not fit the previous chunk
+    
+    with contextlib.nullcontext(executor) if executor else ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = {}
+        in_flight = 0  # Estimated decoded bytes of the submitted chunks
+        held = None  # Next chunk, waiting for memory to free up
+        try:
+            while True:
+                # Keep every worker busy with a small backlog, without queueing the whole job
+                while len(pending) < workers * 2:
+                    if held is None:
+                        held = yield from _next_chunk(items, carry, max(1, chunk_size), chunk_budget, emit)
+                    chunk, cost = held
+                    if not chunk:
+                        held = None
+                        break
+                    if memory_budget and pending and in_flight + cost > memory_budget:
+                        break  # Admit it once running chunks release their memory
+                    
+                    hints = [quality_hint(path) for path in chunk]
+                    pending[executor.submit(_convert_chunk, pipeline, chunk, *task_args, hints)] = held
+                    in_flight += cost
+                    held = None
+                
+                if not pending:
+                    break
+                
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    chunk, cost = pending.pop(future)
+                    in_flight -= cost
+                    try:
+                        chunk_results = future.result()
+                    except Exception as e:
+                        # The worker itself died (e.g. BrokenProcessPool), not a single conversion
+                        chunk_results = [_failed_result(path, e) for path in chunk]
+                    for result in chunk_results:
+                        yield from emit(result)
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+async def convert_image_async(source, output_format, max_width=None, quality=85, output_folder=None,
+                              resize_mode="exact", executor=None, profile=None):
+    """Convert one image without blocking the event loop.
+    
+    The work runs on `executor` (default: a shared process pool with one
+    worker per core). Cancelling the awaiting task drops the job if it has not
+    started yet. Nothing is printed.
+    
+    Args:
+        source: Path to the image file, or its encoded bytes (bytes, bytearray or memoryview)
+        output_format: Target format (png, jpg, jpeg, webp, bmp, ico)
+        max_width: Maximum width for resizing (optional, in pixels)
+        quality: Quality for JPEG/WebP (1-100, default 85)
+        output_folder: Output folder path for path sources (optional, defaults to same as input)
+        resize_mode: "exact" (full decode + LANCZOS) or "fast" (draft decode + reducing_gap)
+        executor: concurrent.futures executor to run on (optional)
+        profile: Encoder profile, "fastest", "balanced" or "smallest" (optional, default Pillow's settings)
+    
+    Returns:
+        The encoded output bytes for in-memory sources (errors are raised), or
+        the result dict (see `iter_convert_images`) for path sources
+    """
+    loop = asyncio.get_running_loop()
+    executor = executor or _async_executor()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        if isinstance(source, memoryview) and isinstance(executor, ProcessPoolExecutor):
+            source = source.tobytes()  # memoryviews cannot be pickled to a worker process
+        return await loop.run_in_executor(executor, functools.partial(convert_image_bytes, profile=profile), source,
+                                          output_format, max_width, quality, resize_mode)
+    pipeline = ConversionPipeline(output_format, max_width, quality, output_folder, resize_mode, profile=profile)
+    return await loop.run_in_executor(executor, pipeline.convert, str(source))
+
+
+async def iter_convert_images_async(image_files, output_format, max_width=None, quality=85, output_folder=None,
+                                    resize_mode="exact", executor=None, max_pending=None, profile=None):
+    """Async iterator over batch results, in completion order.
+    
+    At most `max_pending` conversions are queued on the pool at once, and no
+    new ones are submitted while the consumer is not iterating, so a slow
+    consumer throttles the batch. Breaking out of the loop (or cancelling the
+    consuming task) cancels everything that has not started yet.
+    
+    Args:
+        image_files: Iterable of image paths
+        output_format: Target format (png, jpg, jpeg, webp, bmp, ico)
+        max_width: Maximum width for resizing (optional, in pixels)
+        quality: Quality for JPEG/WebP (1-100, default 85)
+        output_folder: Output folder path (optional, defaults to same folder)
+        resize_mode: "exact" (full decode + LANCZOS) or "fast" (draft decode + reducing_gap)
+        executor: concurrent.futures executor to run on (optional, default shared process pool)
+        max_pending: Conversions queued at once (default two per CPU core)
+        profile: Encoder profile, "fastest", "balanced" or "smallest" (optional, default Pillow's settings)
+    
+    Yields:
+        Result dicts, as for `iter_convert_images`
+    """
+    loop = asyncio.get_running_loop()
+    executor = executor or _async_executor()
+    max_pending = max_pending or 2 * (os.cpu_count() or 1)
+    pipeline = ConversionPipeline(output_format, max_width, quality, output_folder, resize_mode, profile=profile)
+    files = iter(image_files)
+    pending = set()
+    try:
+        while True:
+            while len(pending) < max_pending:
+                image_path = next(files, None)
+                if image_path is None:
+                    break
+                pending.add(loop.run_in_executor(executor, pipeline.convert, str(image_path)))
+            if not pending:
+                break
+            
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _async_executor():
+    """Return the process pool shared by the async API, creating it on first use."""
+    global _async_pool
+    if _async_pool is None:
+        _async_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+    return _async_pool
+
+
+def estimate_footprint(image_path, max_width=None, resize_mode="exact"):
+    """Estimate the peak bytes a conversion needs, reading only the image header.
+    
+    Counts the decoded image (at the reduced scale the JPEG decoder will use in
+    fast mode) plus the resized and mode-converted copies.
+    
+    Returns:
+        Estimated bytes, or 0 if the header cannot be read (the conversion will report the error)
+    """
+    try:
+        with Image.open(image_path) as img:
+            header = {"format": img.format, "width": img.width, "height": img.height, "mode": img.mode}
+    except Exception:
+        return 0
+    return _estimate_bytes(header, max_width, resize_mode)
+
+
+def _estimate_bytes(probe, max_width=None, resize_mode="exact"):
+    """The arithmetic of `estimate_footprint`, on a header dict (see `probe_image`); 0 for unreadable files."""
+    if probe.get("error") or not probe.get("width"):
+        return 0
+    width, height = probe["width"], probe["height"]
+    bytes_per_pixel = _BYTES_PER_PIXEL.get(probe["mode"], 4)
+    
+    decoded_width, decoded_height = width, height
+    output_pixels = width * height
+    if max_width and width > max_width:
+        target_height = max(1, int(height * max_width / width))
+        output_pixels = max_width * target_height
+        if resize_mode == "fast" and probe["format"] == "JPEG":
+            # Same scale choice as the JPEG decoder's draft mode
+            scale = next(s for s in (8, 4, 2, 1) if min(width // max_width, height // target_height) >= s)
+            decoded_width, decoded_height = -(-width // scale), -(-height // scale)
+    
+    return (decoded_width * decoded_height + 2 * output_pixels) * bytes_per_pixel
+
+
+def _preflight(planned, probe_index, pipeline):
+    """Probe every planned file, failing unreadable ones and passing the rest on largest first.
+    
+    Results already in `planned` (up to date, deduplicated) go straight through.
+    """
+    files = []
+    for item in planned:
+        if isinstance(item, dict):
+            yield item
+            continue
+        probe = probe_index.probe(item)
+        if probe["error"]:
+            yield _failed_result(item, f"Not a readable image: {probe['error']}")
+        else:
+            files.append((_estimate_bytes(probe, pipeline.decode_width, pipeline.resize_mode), item))
+    
+    # Stable sort: equally sized files keep their scan order
+    files.sort(key=lambda entry: -entry[0])
+    for _, item in files:
+        yield item
+
+
+def _next_chunk(items, carry, chunk_size, chunk_budget, emit):
+    """Collect the next chunk of (path, estimated bytes) items, yielding finished results on the way.
+    
+    Returns (chunk, cost); used with `yield from`. An item that would push a
+    non-empty chunk over chunk_budget is put back into `carry`.
+    """
+    chunk, cost = [], 0
+    while len(chunk) < chunk_size:
+        item, item_cost = carry.pop() if carry else next(items, (None, 0))
+        if item is None:
+            break
+        if isinstance(item, dict):
+            yield from emit(item)  # Up to date or deduplicated, nothing to dispatch
+            continue
+        if chunk and chunk_budget and cost + item_cost > chunk_budget:
+            carry.append((item, item_cost))
+            break
+        chunk.append(item)
+        cost += item_cost
+    return chunk, cost
+
+
+class ConversionPipeline:
+    """A conversion job's settings, worked out once and reused for every file.
+    
+    The Pillow format and save options of every output, the order in which
+    widths are produced and the output naming are resolved up front, so a
+    file only goes through decode → resize → stages → mode convert → encode.
+    convert_image, the batch engine, the async and in-memory APIs and the GUI
+    all convert through this class. Instances can be sent to worker processes.
+    
+    Stages are callables taking and returning a PIL image, run in order on
+    each resized image right before it is encoded (they may change it in
+    place), e.g. `convert_to_srgb`, `functools.partial(sharpen, percent=120)`
+    or `strip_metadata`. Use module-level functions or partials of them so
+    the pipeline stays picklable.
+    
+    With max_bytes and/or min_ssim, the quality of JPEG/WebP outputs is not
+    fixed but searched: the resized image is encoded to memory at the
+    qualities a binary search asks for, and the winning bytes are written
+    as they are. min_ssim picks the lowest quality whose SSIM (measured on a
+    grayscale copy reduced to 512px) reaches the target; max_bytes the
+    highest quality that fits. With both, the SSIM pick is lowered further
+    if it does not fit. A quality hint (the previous run's choice) is tried
+    first, so an unchanged image settles in two trial encodes.
+    
+    An encoder profile (see ENCODER_PROFILES) adds tuned save options per
+    format: "fastest" trades size for encode speed, "smallest" spends encode
+    time (optimized progressive JPEG, WebP method 6, PNG level 9) on size.
+    Without one, Pillow's defaults apply.
+    
+    Args:
+        output_format: Target format (png, jpg, jpeg, webp, bmp, ico); the default for targets
+        max_width: Maximum width for resizing (optional, in pixels)
+        quality: Quality for JPEG/WebP (1-100, default 85)
+        output_folder: Output folder path (optional, defaults to same folder as each input)
+        resize_mode: "exact" (full decode + LANCZOS) or "fast" (draft decode + reducing_gap)
+        targets: Output specs to fan each image out to (see `convert_image_variants`) (optional)
+        source_root: Mirror each file's subfolder of source_root under output_folder (optional)
+        stages: Image callables run after resizing, in order (optional)
+        max_bytes: Largest acceptable JPEG/WebP output in bytes; the quality is searched (optional)
+        min_ssim: Lowest acceptable SSIM (0-1) of JPEG/WebP outputs; the quality is searched (optional)
+        profile: Encoder profile name from ENCODER_PROFILES (optional)
+    """
+    
+    def __init__(self, output_format=None, max_width=None, quality=85, output_folder=None, resize_mode="exact",
+                 targets=None, source_root=None, stages=(), max_bytes=None, min_ssim=None, profile=None):
+        if resize_mode not in RESIZE_MODES:
+            raise ValueError(f"resize_mode must be one of {RESIZE_MODES}, got {resize_mode!r}")
+        if profile and profile not in ENCODER_PROFILES:
+            raise ValueError(f"profile must be one of {tuple(ENCODER_PROFILES)}, got {profile!r}")
+        if max_width and not isinstance(max_width, int):
+            max_width = None
+        
+        self.variants = bool(targets)
+        if targets:
+            self.targets = _normalize_targets(targets, output_format, max_width, quality)
+            settings = [[list(target) for target in self.targets], resize_mode]
+        elif output_format:
+            self.targets = [(output_format.lower(), max_width, quality)]
+            settings = [output_format.lower(), max_width, quality, resize_mode]
+        else:
+            raise ValueError("An output format or targets are required")
+        for target in self.targets:
+            _check_output(*target)
+        self.output_folder = output_folder
+        self.resize_mode = resize_mode
+        self.source_root = source_root
+        self.stages = tuple(stages)
+        if self.stages:
+            settings.append([_stage_name(stage) for stage in self.stages])
+        self.max_bytes = max_bytes
+        self.min_ssim = min_ssim
+        if max_bytes or min_ssim:
+            settings.append({"max_bytes": max_bytes, "min_ssim": min_ssim})
+        self.profile = profile
+        if profile:
+            settings.append(profile)
+        self.settings = settings  # Identifies the output in manifest keys
+        
+        # Per output: (format, Pillow format, save options, RGB needed, file name suffix)
+        self.outputs = [(fmt, _pillow_format(fmt), _save_kwargs(fmt, target_quality, profile), fmt in ('jpg', 'jpeg'),
+                         f"_{width}w_converted" if self.variants and width else "_converted")
+                        for fmt, width, target_quality in self.targets]
+        
+        # Original size first, then each smaller width resized from the previous one
+        widths = sorted({width for _, width, _ in self.targets}, key=lambda width: -width if width else float("-inf"))
+        self.plan = [(width, [idx for idx, (_, target_width, _) in enumerate(self.targets) if target_width == width])
+                     for width in widths]
+        self.decode_width = widths[0]  # None when an output keeps the original size
+    
+    def output_for(self, input_path):
+        """Return the output path for an input (a list of paths with targets)."""
+        paths = [_output_path(input_path, fmt, self.output_folder, suffix, self.source_root)
+                 for fmt, _, _, _, suffix in self.outputs]
+        return paths if self.variants else paths[0]
+    
+    @property
+    def searches_quality(self):
+        """True when output qualities are searched for a size or SSIM target."""
+        return bool(self.max_bytes or self.min_ssim)
+    
+    def convert(self, input_path, collect_metrics=False, resize_mode=None, quality_hint=None):
+        """Convert one image file and describe the outcome instead of printing or raising.
+        
+        quality_hint is a previous result's "quality" for this file, tried
+        first when qualities are searched.
+        
+        Returns:
+            Result dict, see `iter_convert_images`
+        """
+        clock = _StageClock(input_path) if collect_metrics else None
+        output = self.output_for(input_path)
+        output_paths = output if self.variants else [output]
+        if quality_hint is not None and not self.variants:
+            quality_hint = [quality_hint]
+        try:
+            if self.source_root:
+                os.makedirs(os.path.dirname(output_paths[0]), exist_ok=True)
+            sizes, qualities, targets_met = self._run(input_path, output_paths, resize_mode or self.resize_mode,
+                                                      clock, quality_hint)
+        except Exception as e:
+            return _failed_result(input_path, e, clock)
+        result = {"input": str(input_path), "output": output, "status": "converted",
+                  "size": sizes if self.variants else sizes[0], "error": None,
+                  "metrics": clock.finish("converted") if clock else None}
+        if self.searches_quality:
+            result["quality"] = qualities if self.variants else qualities[0]
+            result["target_met"] = targets_met
+        return result
+    
+    def convert_stream(self, source, destination, clock=None):
+        """Convert between paths or binary file objects (single output only); raises on failure.
+        
+        Returns:
+            The (width, height) of the saved image
+        """
+        if self.variants:
+            raise ValueError("convert_stream writes a single output; use convert for targets")
+        return self._run(source, [destination], self.resize_mode, clock)[0][0]
+    
+    def _run(self, source, destinations, resize_mode, clock=None, quality_hints=None):
+        """Decode once, then resize, run the stages and encode for every planned width.
+        
+        A width the image already fits is a no-op resize: its outputs reuse the
+        previous width's pixels and stages, and an output identical to one
+        already written (same pixels, format and save options) is linked or
+        copied from it instead of being encoded again.
+        
+        An animated or multi-page source keeps all its frames in GIF, WebP and
+        TIFF outputs (see `_save_frames`); other formats get the first frame.
+        
+        Returns:
+            Tuple of (sizes, searched qualities (None where fixed), whether every search met its target)
+        """
+        sizes = [None] * len(destinations)
+        qualities = [None] * len(destinations)
+        targets_met = True
+        with Image.open(source) as img:
+            if clock:
+                clock.input_pixels = img.width * img.height
+            _decode(img, self.decode_width, resize_mode)
+            if clock:
+                clock.mark("decode")
+            
+            multi_frame = []  # Outputs written frame by frame after the still ones
+            # Not MPO: a camera JPEG's extra pictures (previews, depth maps) are no frames of one image
+            if img.format in MULTI_FRAME_FORMATS and getattr(img, "n_frames", 1) > 1:
+                multi_frame = [idx for idx, output in enumerate(self.outputs) if output[1] in MULTI_FRAME_FORMATS]
+            
+            current = img
+            staged = None
+            written = {}  # (Pillow format, save options) -> index of the output encoded from `staged`
+            for width, indexes in self.plan:
+                indexes = [idx for idx in indexes if idx not in multi_frame]
+                if not indexes:
+                    continue
+                # Resize if needed
+                resized = _resize_image(current, width, resize_mode) if width else current
+                if width and clock:
+                    clock.mark("resize")
+                if staged is None or resized is not current:
+                    current = staged = resized
+                    for stage in self.stages:
+                        staged = stage(staged)
+                    if self.stages and clock:
+                        clock.mark("stages")
+                    written = {}
+                
+                for idx in indexes:
+                    fmt, pillow_format, save_kwargs, needs_rgb, _ = self.outputs[idx]
+                    destination = destinations[idx]
+                    encoding = (pillow_format, tuple(sorted(save_kwargs.items())))
+                    if encoding in written and isinstance(destination, (str, os.PathLike)):
+                        first = written[encoding]
+                        _link_or_copy(destinations[first], destination)
+                        sizes[idx], qualities[idx] = sizes[first], qualities[first]
+                        continue
+                    output = staged
+                    # Convert specifically for RGB modes if saving to JPEG (which doesn't support transparency)
+                    if needs_rgb and output.mode in ('RGBA', 'P'):
+                        output = output.convert('RGB')
+                        if clock:
+                            clock.mark("convert")
+                    
+                    if self.searches_quality and fmt in LOSSY_FORMATS:
+                        hint = quality_hints[idx] if quality_hints else None
+                        data, qualities[idx], met = self._search_quality(output, pillow_format, save_kwargs, hint)
+                        targets_met = targets_met and met
+                        with _atomic_output(destination) as target:
+                            if isinstance(target, str):
+                                with open(target, "wb") as f:
+                                    f.write(data)
+                            else:
+                                target.write(data)
+                    else:
+                        with _atomic_output(destination) as target:
+                            output.save(target, pillow_format, **save_kwargs)
+                    if clock:
+                        clock.mark("encode")
+                        if isinstance(destination, (str, os.PathLike)):
+                            clock.add_output(output, os.path.getsize(destination))
+                    sizes[idx] = (output.width, output.height)
+                    written[encoding] = idx
+            
+            for idx in multi_frame:
+                sizes[idx] = self._save_frames(img, destinations[idx], idx, resize_mode, clock)
+        return sizes, qualities, targets_met
+    
+    def _save_frames(self, img, destination, idx, resize_mode, clock=None):
+        """Write every frame of a multi-frame source to one output, decoding and resizing them one at a time.
+        
+        Frame durations and the loop count carry over; a frame identical to
+        the previous one is not resized again. GIF and WebP frames all share
+        one canvas, so frames of another size are fitted into the first one's
+        output size; TIFF pages keep their own sizes. Qualities are not
+        searched for multi-frame outputs, the fixed quality applies.
+        
+        Returns:
+            The first frame's output (width, height)
+        """
+        fmt, pillow_format, save_kwargs, _, _ = self.outputs[idx]
+        width = self.targets[idx][1]
+        loop = img.info.get("loop")
+        canvas = []  # The first frame's output size, once processed
+        
+        def process(frame):
+            processed = _resize_image(frame, width, resize_mode) if width else frame
+            for stage in self.stages:
+                processed = stage(processed)
+            if not canvas:
+                canvas.append(processed.size)
+            elif processed.size != canvas[0] and pillow_format in ("GIF", "WEBP"):
+                processed = _fit_frame(processed, canvas[0])
+            # The source frame is overwritten by the next seek
+            return processed.copy() if processed is img else processed
+        
+        frames = _FrameStream(img, process)
+        save_kwargs = dict(save_kwargs, save_all=True)
+        if pillow_format in ("GIF", "WEBP"):
+            save_kwargs["duration"] = frames.durations  # Filled in as the writer seeks
+            if loop is not None:
+                save_kwargs["loop"] = loop
+            elif pillow_format == "WEBP":
+                save_kwargs["loop"] = 1  # A GIF without a loop extension plays once; WebP's default loops forever
+        
+        with _atomic_output(destination) as target:
+            frames.save(target, pillow_format, **save_kwargs)
+        if clock:
+            clock.mark("encode")
+            if isinstance(destination, (str, os.PathLike)):
+                clock.add_output(frames, os.path.getsize(destination))
+        return canvas[0]
+    
+    def preview(self, img, source_size, sample=None):
+        """Encode a downscaled copy of an image the way `convert` would, estimating the full-size output.
+        
+        `img` is the copy and `sample` an optional crop of the original at full
+        resolution (see `PreviewCache`); `source_size` is the original's
+        (width, height). The first output's width, stages, format, quality and
+        save options apply; qualities are not searched. When the output is no
+        larger than the copy it is encoded at its exact size and the byte count
+        is measured. Otherwise bytes per pixel are measured on the copy and on
+        the sample and interpolated to the output's scale (downscaling smooths
+        detail away, so a small copy alone underestimates a large output).
+        
+        Returns:
+            Dict with size (output width, height), bytes (estimated output size), exact
+            (whether bytes is measured) and image (the encoded copy, decoded again)
+        """
+        fmt, pillow_format, save_kwargs, needs_rgb, _ = self.outputs[0]
+        width = self.targets[0][1]
+        source_width, source_height = source_size
+        if width and source_width > width:
+            size = (width, int(source_height * width / source_width))
+        else:
+            size = (source_width, source_height)
+        if size[0] <= img.width and size != img.size:
+            img = img.resize(size, Image.Resampling.LANCZOS)
+        
+        def encode(image):
+            for stage in self.stages:
+                image = stage(image)
+            if needs_rgb and image.mode in ('RGBA', 'P'):
+                image = image.convert('RGB')
+            buffer = io.BytesIO()
+            image.save(buffer, pillow_format, **save_kwargs)
+            return buffer, buffer.tell() / (image.width * image.height)
+        
+        buffer, bits = encode(img)
+        encoded = Image.open(buffer)
+        encoded.load()
+        exact = img.size == size
+        if exact or pillow_format == "ICO":
+            estimate = buffer.tell()  # Icons are capped at 256px, whatever the source size
+        else:
+            if sample is not None and img.width < source_width:
+                # Log-linear in scale between the copy's and the sample's (full) resolution
+                sample_bits = encode(sample)[1]
+                copy_scale = img.width / source_width
+                weight = math.log(size[0] / img.width) / math.log(1 / copy_scale)
+                bits *= (sample_bits / bits) ** weight
+            estimate = bits * size[0] * size[1]
+        return {"size": size, "bytes": round(estimate), "exact": exact, "image": encoded}
+    
+    def _search_quality(self, img, pillow_format, save_kwargs, hint=None):
+        """Find the quality meeting min_ssim/max_bytes by trial encodes of img into memory.
+        
+        Returns:
+            Tuple of (encoded bytes, chosen quality, whether the targets were met)
+        """
+        encoded = {}  # quality -> bytes, so the winner is never encoded twice
+        
+        def encode(quality):
+            if quality not in encoded:
+                buffer = io.BytesIO()
+                img.save(buffer, pillow_format, **dict(save_kwargs, quality=quality))
+                encoded[quality] = buffer.getvalue()
+            return encoded[quality]
+        
+        met = True
+        quality = None
+        if self.min_ssim:
+            reference = _ssim_image(img)
+            quality = _lowest_quality(
+                lambda q: _ssim(reference, _ssim_image(Image.open(io.BytesIO(encode(q))), reference.size))
+                >= self.min_ssim, hint)
+            if quality is None:
+                quality, met = 100, False
+        if self.max_bytes and (quality is None or len(encode(quality)) > self.max_bytes):
+            # The lowest quality that no longer fits, minus one, is the highest that does
+            too_big = _lowest_quality(lambda q: len(encode(q)) > self.max_bytes, hint + 1 if hint else None)
+            if quality is not None:
+                met = False  # The SSIM target had to give way to the size cap
+            quality = too_big - 1 if too_big is not None else 100
+            if quality < 1:
+                quality, met = 1, False
+        return encode(quality), quality, met
+
+
+def strip_metadata(img):
+    """Pipeline stage: drop EXIF, XMP, ICC profile and comments so they are not written out."""
+    for key in ("exif", "xmp", "XML:com.adobe.xmp", "icc_profile", "comment", "photoshop"):
+        img.info.pop(key, None)
+    return img
+
+
+def convert_to_srgb(img):
+    """Pipeline stage: convert pixels from the embedded ICC profile to sRGB (no-op without one)."""
+    icc_profile = img.info.get("icc_profile")
+    if not icc_profile or img.mode not in ("RGB", "RGBA", "CMYK", "L"):
+        return img
+    if ImageCms is None:
+        raise RuntimeError("convert_to_srgb needs Pillow built with LittleCMS (PIL.ImageCms)")
+    output_mode = "RGBA" if img.mode == "RGBA" else "RGB"
+    converted = ImageCms.profileToProfile(img, ImageCms.ImageCmsProfile(io.BytesIO(icc_profile)),
+                                          ImageCms.createProfile("sRGB"), outputMode=output_mode)
+    converted.info = {key: value for key, value in img.info.items() if key != "icc_profile"}
+    return converted
+
+
+def sharpen(img, radius=1.0, percent=80, threshold=2):
+    """Pipeline stage: unsharp mask, to restore crispness lost when downscaling."""
+    if img.mode in ("P", "1"):
+        return img  # Filters need real pixel values
+    sharpened = img.filter(ImageFilter.UnsharpMask(radius, percent, threshold))
+    sharpened.info = img.info
+    return sharpened
+
+
+def _lowest_quality(accept, hint=None, low=1, high=100):
+    """Binary search for the lowest quality in low..high that accept() holds for (accept must be monotonic).
+    
+    A hint is tried first together with its neighbour, so repeating an
+    earlier answer costs two trials instead of seven. Returns None when no
+    quality is accepted.
+    """
+    end = high + 1  # Lowest quality known to be accepted, or high + 1 if none is yet
+    if hint is not None and low <= hint <= high:
+        if accept(hint):
+            if hint == low or not accept(hint - 1):
+                return hint
+            end = hint - 1
+        else:
+            low = hint + 1
+    while low < end:
+        middle = (low + end) // 2
+        if accept(middle):
+            end = middle
+        else:
+            low = middle + 1
+    return low if low <= high else None
+
+
+def _ssim_image(img, size=None):
+    """Return the grayscale float image SSIM is measured on, reduced to _SSIM_SIZE (or to size)."""
+    gray = img.convert("L")
+    if size is None and max(gray.size) > _SSIM_SIZE:
+        scale = _SSIM_SIZE / max(gray.size)
+        size = (max(1, round(gray.width * scale)), max(1, round(gray.height * scale)))
+    if size is not None and size != gray.size:
+        gray = gray.resize(size, Image.Resampling.BOX)
+    return gray.convert("F")
+
+
+def _ssim(x, y, block=_SSIM_BLOCK):
+    """Mean SSIM of two equally sized "F" images over block x block windows.
+    
+    Window means and second moments come from Image.reduce (box averages in
+    C), so only the per-window formula runs in Python.
+    """
+    moments = [image.reduce(block) for image in (x, y, _multiply(x, x), _multiply(y, y), _multiply(x, y))]
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    total = 0.0
+    for mean_x, mean_y, xx, yy, xy in zip(*(array.array("f", moment.tobytes()) for moment in moments)):
+        variance_x, variance_y = xx - mean_x * mean_x, yy - mean_y * mean_y
+        covariance = xy - mean_x * mean_y
+        total += (((2 * mean_x * mean_y + c1) * (2 * covariance + c2))
+                  / ((mean_x * mean_x + mean_y * mean_y + c1) * (variance_x + variance_y + c2)))
+    return total / (moments[0].width * moments[0].height)
+
+
+def _multiply(a, b):
+    """Pixel-wise product of two "F" images."""
+    if hasattr(ImageMath, "lambda_eval"):
+        return ImageMath.lambda_eval(lambda args: args["a"] * args["b"], a=a, b=b)
+    return ImageMath.eval("a * b", a=a, b=b)  # Pillow < 10.3
+
+
+class BatchMetrics:
+    """Aggregate per-file conversion stats into counters, stage totals and latency histograms.
+    
+    Pass an instance as `metrics=` to convert_image, batch_convert_images or
+    iter_convert_images; it is called once per file with a stats dict (input,
+    status, error_type, stages in seconds, input/output bytes and pixels).
+    Any other callable taking that dict works as well. Without a metrics hook
+    nothing is timed at all.
+    
+    Args:
+        on_file: Optional callable also given every per-file stats dict (e.g. to forward to monitoring)
+    """
+    
+    HISTOGRAM_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000)
+    
+    def __init__(self, on_file=None):
+        self.on_file = on_file
+        self.counters = dict.fromkeys(("files", "converted", "skipped", "failed", "input_bytes", "output_bytes",
+                                       "input_pixels", "output_pixels"), 0)
+        self.stage_seconds = {}
+        self.histograms = {}  # stage -> counts per bucket, the last one counting everything above the largest bound
+        self.errors = {}  # exception type name -> count
+        self.started = time.perf_counter()
+    
+    def __call__(self, stats):
+        self.counters["files"] += 1
+        self.counters[stats["status"]] += 1
+        for key in ("input_bytes", "output_bytes", "input_pixels", "output_pixels"):
+            self.counters[key] += stats.get(key) or 0
+        if stats.get("error_type"):
+            self.errors[stats["error_type"]] = self.errors.get(stats["error_type"], 0) + 1
+        
+        stages = stats.get("stages") or {}
+        for stage, seconds in itertools.chain(stages.items(), [("total", stats.get("seconds"))]):
+            if seconds is None:
+                continue
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+            buckets = self.histograms.setdefault(stage, [0] * (len(self.HISTOGRAM_BUCKETS_MS) + 1))
+            buckets[bisect.bisect_left(self.HISTOGRAM_BUCKETS_MS, seconds * 1000)] += 1
+        
+        if self.on_file:
+            self.on_file(stats)
+    
+    def summary(self):
+        """Return the aggregated metrics as a JSON-serializable dict."""
+        elapsed = time.perf_counter() - self.started
+        labels = [f"<={bound}ms" for bound in self.HISTOGRAM_BUCKETS_MS] + [f">{self.HISTOGRAM_BUCKETS_MS[-1]}ms"]
+        return {
+            "elapsed_seconds": round(elapsed, 6),
+            "images_per_sec": round(self.counters["converted"] / elapsed, 3) if elapsed else None,
+            "counters": dict(self.counters),
+            "stage_seconds": {stage: round(seconds, 6) for stage, seconds in self.stage_seconds.items()},
+            "histograms": {stage: dict(zip(labels, buckets)) for stage, buckets in self.histograms.items()},
+            "errors": dict(self.errors),
+        }
+    
+    def format_stages(self):
+        """One-line breakdown of where the time went, e.g. for the end of a batch."""
+        stages = [f"{stage} {self.stage_seconds[stage]:.2f}s"
+                  for stage in ("decode", "resize", "stages", "convert", "encode")
+                  if stage in self.stage_seconds]
+        return " · ".join(stages) if stages else "no files timed"
+
+
+def probe_image(image_path):
+    """Read what a batch needs to plan a file from its header, without decoding any pixels.
+    
+    Returns:
+        Dict with format, width, height, mode, frames (1 for still images),
+        orientation (the EXIF tag, 1 = upright) and error (None, or why the
+        file is not a readable image, in which case the other fields are None)
+    """
+    try:
+        with Image.open(image_path) as img:
+            if img.format == "PNG":
+                # PngImageFile.getexif() decodes the image to look for a trailing eXIf chunk
+                exif = Image.Exif()
+                if "exif" in img.info:
+                    exif.load(img.info["exif"])
+            else:
+                exif = img.getexif()
+            return {"format": img.format, "width": img.width, "height": img.height, "mode": img.mode,
+                    "frames": getattr(img, "n_frames", 1), "orientation": exif.get(_EXIF_ORIENTATION, 1),
+                    "error": None}
+    except Exception as e:
+        return dict(dict.fromkeys(_PROBE_FIELDS), error=str(e) or type(e).__name__)
+
+
+class ProbeIndex:
+    """Header probes (see `probe_image`) cached in an SQLite file between runs.
+    
+    A probe is reused while the file's size and mtime are unchanged, so
+    planning a large tree again costs a stat per file instead of opening
+    every image. Unreadable files are remembered too. The default ":memory:"
+    index only lives as long as the object. Use it from one thread.
+    
+    Args:
+        index_path: SQLite database file (created if missing, emptied if
+            outdated; see `check` for files that are refused)
+    """
+    
+    COMMIT_EVERY = 500  # New probes written per transaction
+    
+    def __init__(self, index_path=":memory:"):
+        self.index_path = str(index_path)
+        self.check(self.index_path)
+        self.connection = self._open()
+        self.cache = {}  # path -> (size, mtime_ns, probe) for files seen by this instance
+        self.uncommitted = 0
+    
+    @staticmethod
+    def check(index_path):
+        """Raise ValueError unless `index_path` is missing, empty or a probe index (of any version).
+        
+        The index is only a cache, but the path is the user's: a file that is
+        not an SQLite database, a broken one, or one with tables of its own is
+        refused instead of being replaced.
+        """
+        index_path = str(index_path)
+        if index_path == ":memory:" or not os.path.isfile(index_path) or os.path.getsize(index_path) == 0:
+            return
+        with open(index_path, "rb") as f:
+            if f.read(16) != b"SQLite format 3\x00":
+                raise ValueError(f"{index_path} is not a probe index (not an SQLite database)")
+        connection = None
+        try:
+            connection = sqlite3.connect(index_path)
+            tables = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        except sqlite3.DatabaseError as e:
+            raise ValueError(f"{index_path} is not a usable probe index: {e}") from None
+        finally:
+            if connection is not None:
+                connection.close()
+        if tables - {"probes"}:
+            raise ValueError(f"{index_path} is not a probe index (it has tables {', '.join(sorted(tables))})")
+    
+    def _open(self):
+        connection = sqlite3.connect(self.index_path)
+        if connection.execute("PRAGMA user_version").fetchone()[0] != PROBE_INDEX_VERSION:
+            connection.execute("DROP TABLE IF EXISTS probes")
+            connection.execute(f"PRAGMA user_version = {PROBE_INDEX_VERSION}")
+        connection.execute("CREATE TABLE IF NOT EXISTS probes (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, "
+                           "format TEXT, width INTEGER, height INTEGER, mode TEXT, frames INTEGER, "
+                           "orientation INTEGER, error TEXT)")
+        connection.commit()
+        return connection
+    
+    def probe(self, image_path):
+        """Return the file's probe, reading its header only if it changed since it was indexed."""
+        path = str(image_path)
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            return dict(dict.fromkeys(_PROBE_FIELDS), error=str(e))
+        
+        cached = self.cache.get(path)
+        if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+            return cached[2]
+        row = self.connection.execute(f"SELECT size, mtime_ns, {', '.join(_PROBE_FIELDS)} FROM probes WHERE path = ?",
+                                      (path,)).fetchone()
+        if row and row[:2] == (stat.st_size, stat.st_mtime_ns):
+            probe = dict(zip(_PROBE_FIELDS, row[2:]))
+        else:
+            probe = probe_image(path)
+            self.connection.execute(f"INSERT OR REPLACE INTO probes VALUES (?, ?, ?, {', '.join('?' * len(_PROBE_FIELDS))})",
+                                    (path, stat.st_size, stat.st_mtime_ns, *(probe[key] for key in _PROBE_FIELDS)))
+            self.uncommitted += 1
+            if self.uncommitted >= self.COMMIT_EVERY:
+                self.commit()
+        self.cache[path] = (stat.st_size, stat.st_mtime_ns, probe)
+        return probe
+    
+    def evict(self):
+        """Drop entries whose file no longer exists. Returns the number removed."""
+        stale = [(path,) for path, in self.connection.execute("SELECT path FROM probes") if not os.path.exists(path)]
+        self.connection.executemany("DELETE FROM probes WHERE path = ?", stale)
+        self.commit()
+        return len(stale)
+    
+    def commit(self):
+        """Write pending probes to disk."""
+        self.connection.commit()
+        self.uncommitted = 0
+    
+    def close(self):
+        """Commit and close the database."""
+        self.commit()
+        self.connection.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class PixelProgress:
+    """Batch progress and ETA weighted by decoded pixels rather than file count.
+    
+    Creating one probes every file (filling the index for the batch that
+    follows). Finished files then advance progress by their pixel count, so a
+    40 MP panorama moves the ETA as much as a hundred thumbnails do. Skipped
+    and deduplicated files took no conversion time and are taken out of the
+    total instead.
+    
+    Args:
+        probe_index: ProbeIndex to probe the files with
+        image_files: Iterable of the batch's image paths
+    """
+    
+    def __init__(self, probe_index, image_files):
+        self.probe_index = probe_index
+        self.files = 0
+        self.unreadable = 0
+        self.pixels = 0  # Still to convert, shrinks as files are skipped
+        self.done_pixels = 0
+        for path in image_files:
+            probe = probe_index.probe(path)
+            self.files += 1
+            self.unreadable += 1 if probe["error"] else 0
+            self.pixels += self._weight(probe)
+        self.started = time.perf_counter()
+    
+    @staticmethod
+    def _weight(probe):
+        return (probe["width"] or 0) * (probe["height"] or 0)
+    
+    def update(self, result):
+        """Account for one finished result (see `iter_convert_images`)."""
+        weight = self._weight(self.probe_index.probe(result["input"]))
+        if result["status"] == "skipped" or result.get("duplicate_of"):
+            self.pixels -= weight
+        else:
+            self.done_pixels += weight
+    
+    @property
+    def fraction(self):
+        """Share of the batch's pixels converted so far (0-1)."""
+        return min(1.0, self.done_pixels / self.pixels) if self.pixels > 0 else 1.0
+    
+    def eta(self, elapsed=None):
+        """Estimated seconds left at the pixel rate so far, or None before the first conversion finished."""
+        if elapsed is None:
+            elapsed = time.perf_counter() - self.started
+        if not self.done_pixels or elapsed <= 0:
+            return None
+        return max(0.0, elapsed * (self.pixels - self.done_pixels) / self.done_pixels)
+
+
+class PreviewCache:
+    """Decoded, downscaled copies of recently previewed images; the least recently used is dropped first.
+    
+    The first preview of a file decodes it once and keeps a copy no larger
+    than `size` on its longest side, plus a `size` x `size` crop from the
+    center at full resolution for the byte estimate, so trying other
+    settings afterwards only re-encodes those (see
+    `ConversionPipeline.preview`). A copy is reused while the file's size and
+    mtime are unchanged. Safe to share between threads.
+    
+    Args:
+        size: Longest side of the kept copies in pixels (default PREVIEW_SIZE)
+        capacity: Number of copies kept (default PREVIEW_CACHE_SIZE)
+    """
+    
+    def __init__(self, size=PREVIEW_SIZE, capacity=PREVIEW_CACHE_SIZE):
+        self.size = size
+        self.capacity = capacity
+        self.entries = collections.OrderedDict()  # (path, size, mtime_ns) -> (copy, full-size sample, source size)
+        self.lock = threading.Lock()
+    
+    def get(self, image_path):
+        """Return (downscaled copy, full-resolution center crop, (source width, source height)) of an image's first frame."""
+        stat = os.stat(image_path)
+        key = (os.path.abspath(image_path), stat.st_size, stat.st_mtime_ns)
+        with self.lock:
+            if key not in self.entries:
+                with Image.open(image_path) as img:
+                    img.load()
+                    source_size = img.size
+                    left, top = max(0, (img.width - self.size) // 2), max(0, (img.height - self.size) // 2)
+                    sample = img.crop((left, top, left + min(self.size, img.width), top + min(self.size, img.height)))
+                    copy = img.copy()
+                copy.thumbnail((self.size, self.size), Image.Resampling.LANCZOS)
+                self.entries[key] = (copy, sample, source_size)
+                while len(self.entries) > self.capacity:
+                    self.entries.popitem(last=False)
+            self.entries.move_to_end(key)
+            return self.entries[key]
+    
+    def preview(self, image_path, pipeline):
+        """Preview an image file's output under a ConversionPipeline (see `ConversionPipeline.preview`).
+        
+        Returns:
+            The preview dict, plus source_size (the file's width, height) and source_bytes
+        """
+        img, sample, source_size = self.get(image_path)
+        return dict(pipeline.preview(img, source_size, sample), source_size=source_size,
+                    source_bytes=os.path.getsize(image_path))
+
+
+class BatchJournal:
+    """Write-ahead NDJSON journal of one folder batch, so an interrupted run resumes where it stopped.
+    
+    Every file is logged as "queued" when the scan hands it to the batch, a
+    "scan_done" record follows the last one, and a "done" record follows each
+    finished output (after it was renamed into place). Reopening the journal
+    of the same job replays it: finished files are reported as skipped
+    without being opened, and once the scan had completed the remaining files
+    come from the journal instead of a rescan. A record torn by a crash is
+    dropped, failed files are tried again, and a journal written for other
+    settings is started over.
+    
+    Args:
+        journal_path: NDJSON file (created if missing)
+        folder_path: Folder the batch converts; journaled paths are relative to it
+        job: JSON-able description of the scan filters and conversion settings
+    """
+    
+    SYNC_EVERY = 100  # Records written between fsyncs
+    
+    def __init__(self, journal_path, folder_path, job):
+        self.journal_path = str(journal_path)
+        self.folder = Path(folder_path)
+        self.job = [os.path.abspath(folder_path), json.loads(json.dumps(job))]
+        self.queued = {}  # relative path -> None, in scan order
+        self.done = {}  # relative path -> "done" record of a finished file
+        self.scan_done = False
+        self.resumed = self._load()
+        if not self.resumed:
+            self.queued, self.done, self.scan_done = {}, {}, False
+            with open(self.journal_path, "w", encoding="utf-8") as f:
+                f.write(json.dumps({"record": "job", "version": JOURNAL_VERSION, "job": self.job}) + "\n")
+        self.file = open(self.journal_path, "a", encoding="utf-8")
+        self.unsynced = 0
+    
+    def _load(self):
+        try:
+            with open(self.journal_path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return False
+        records = []
+        length = 0  # Bytes of complete records
+        for line in data.splitlines(keepends=True):
+            try:
+                if not line.endswith(b"\n"):
+                    raise ValueError("torn record")
+                records.append(json.loads(line))
+            except ValueError:
+                break  # Written when the run was killed; everything after it is lost too
+            length += len(line)
+        if not records or records[0] != {"record": "job", "version": JOURNAL_VERSION, "job": self.job}:
+            return False
+        
+        for record in records[1:]:
+            if record["record"] == "queued":
+                self.queued[record["path"]] = None
+            elif record["record"] == "scan_done":
+                self.scan_done = True
+            elif record["status"] == "failed":
+                self.done.pop(record["path"], None)
+            else:
+                self.done[record["path"]] = record
+        if length < len(data):
+            with open(self.journal_path, "r+b") as f:
+                f.truncate(length)
+        return True
+    
+    def _write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+        self.unsynced += 1
+        if self.unsynced >= self.SYNC_EVERY:
+            self.sync()
+    
+    def _relative(self, path):
+        return Path(os.path.relpath(path, self.folder)).as_posix()
+    
+    @property
+    def total(self):
+        """Number of files the batch has, or None while the journaled scan is incomplete."""
+        return len(self.queued) if self.scan_done else None
+    
+    def replay(self, manifest=None):
+        """Yield a "skipped" result for every journaled file whose outputs still exist.
+        
+        Their manifest entries are restored into `manifest`, since the run that
+        wrote them may not have lived to save it. Files whose outputs are gone
+        are converted again.
+        """
+        for rel_path, record in list(self.done.items()):
+            if not _outputs_exist(record["output"]):
+                del self.done[rel_path]
+                continue
+            if manifest is not None and record.get("manifest"):
+                key, entry = record["manifest"]
+                manifest.setdefault(key, entry)
+            yield _skipped_result(str(self.folder / rel_path), record["output"])
+    
+    def scan(self, image_files):
+        """Yield the batch's files: the journaled list once a scan completed, else `image_files`, journaling them."""
+        if self.scan_done:
+            for rel_path in list(self.queued):
+                yield self.folder / rel_path
+            return
+        for image_path in image_files:
+            rel_path = self._relative(image_path)
+            if rel_path not in self.queued:
+                self.queued[rel_path] = None
+                self._write({"record": "queued", "path": rel_path})
+            yield image_path
+        self.scan_done = True
+        self._write({"record": "scan_done", "files": len(self.queued)})
+    
+    def pending(self, image_files):
+        """Yield the paths of `image_files` that are not done yet."""
+        for image_path in image_files:
+            if self._relative(image_path) not in self.done:
+                yield image_path
+    
+    def record(self, result, manifest=None, settings=None):
+        """Journal a finished result, with its manifest entry if `manifest` and its `settings` are given."""
+        rel_path = self._relative(result["input"])
+        if rel_path in self.done:
+            return  # Replayed
+        record = {"record": "done", "path": rel_path, "status": result["status"], "output": result["output"]}
+        if manifest is not None and result["status"] == "converted":
+            key = json.dumps([os.path.abspath(result["input"])] + settings)
+            if key in manifest:
+                record["manifest"] = [key, manifest[key]]
+        if result["status"] != "failed":
+            self.done[rel_path] = record
+        self._write(record)
+    
+    def sync(self):
+        """Force the records written so far to disk."""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+    
+    def close(self, complete=False):
+        """Sync and close the journal; a complete batch has nothing to resume, so its journal is deleted."""
+        self.sync()
+        self.file.close()
+        if complete:
+            os.remove(self.journal_path)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _FrameStream(Image.Image):
+    """A multi-frame source that produces its processed frames one seek at a time.
+    
+    Pillow's save_all writers seek through `n_frames` of the image they are
+    given, so saving this instead of a list of converted frames keeps only
+    the current source frame, its processed copy and the previous frame's
+    bytes in memory while WebP and TIFF encode. The GIF writer still copies
+    every processed frame into a list before writing any, so GIF output
+    holds all frames at output size. A source frame identical to the previous one reuses its
+    processed copy. Frame durations are appended to `durations` as frames are
+    produced; writers read a frame's duration only after seeking to it.
+    
+    Args:
+        source: Opened multi-frame PIL image
+        process: Callable turning a decoded source frame into the output frame
+    """
+    
+    def __init__(self, source, process):
+        super().__init__()
+        self.source = source
+        self.process = process
+        self.n_frames = source.n_frames
+        self.durations = []
+        self.reused = 0  # Frames that were identical to the one before
+        self._frame = None
+        self._previous = None  # (mode, size, bytes) of the previous source frame
+        self.seek(0)
+    
+    def seek(self, frame):
+        if frame >= self.n_frames:
+            raise EOFError("No more frames")
+        if frame == self._frame:
+            return
+        self.source.seek(frame)
+        current = self.source
+        if current.mode == "P":
+            # GIFs decode their first frame paletted and the rest as RGB(A); process every frame alike
+            current = current.convert("RGBA" if "transparency" in current.info else "RGB")
+        else:
+            current.load()
+        
+        key = (current.mode, current.size, current.tobytes())
+        if key == self._previous:
+            self.reused += 1
+        else:
+            self._adopt(self.process(current))
+            self._previous = key
+        if frame == len(self.durations):
+            self.durations.append(self.source.info.get("duration", 0))
+        self._frame = frame
+    
+    def tell(self):
+        return self._frame
+    
+    def _adopt(self, frame):
+        """Make this image show `frame`'s pixels."""
+        self.im = frame.im
+        self._size = frame.size
+        try:
+            self.mode = frame.mode  # A plain attribute before Pillow 10.1
+        except AttributeError:
+            self._mode = frame.mode
+        self.palette = frame.palette
+        self.info = dict(frame.info)
+
+
+class _CountingWriter(io.RawIOBase):
+    """Write-only file object that passes everything on to `out` and counts the bytes, for sinks that cannot tell()."""
+    
+    def __init__(self, out):
+        self.out = out
+        self.written = 0
+    
+    def writable(self):
+        return True
+    
+    def write(self, b):
+        self.out.write(b)
+        size = memoryview(b).nbytes
+        self.written += size
+        return size
+    
+    def flush(self):
+        if hasattr(self.out, "flush"):
+            self.out.flush()
+
+
+class _MemoryReader(io.RawIOBase):
+    """Seekable read-only file object over a buffer, so Pillow can read it without an up-front copy."""
+    
+    def __init__(self, buffer):
+        self._view = memoryview(buffer).cast("B")
+        self._pos = 0
+    
+    def readable(self):
+        return True
+    
+    def seekable(self):
+        return True
+    
+    def readinto(self, b):
+        size = max(0, min(len(b), len(self._view) - self._pos))
+        b[:size] = self._view[self._pos:self._pos + size]
+        self._pos += size
+        return size
+    
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        if offset < 0:
+            raise ValueError(f"negative seek position {offset}")
+        self._pos = offset
+        return self._pos
+    
+    def tell(self):
+        return self._pos
+
+
+class _Deduplicator:
+    """Hold back byte-identical copies of a source until its output exists, then link or copy that output."""
+    
+    def __init__(self, output_for):
+        self.output_for = output_for
+        self.by_size = {}  # file size -> sources being converted, the candidates a later file may duplicate
+        self.digests = {}  # (path, partial) -> hex digest, so each candidate is read at most once per kind
+        self.results = {}  # source -> its finished result
+        self.waiting = {}  # source -> copies to materialize once its result is in
+    
+    def plan(self, planned):
+        """Pass planned items through, holding back duplicates (or yielding their result right away)."""
+        for item in planned:
+            original = None if isinstance(item, dict) else self._original_of(item)
+            if original is None:
+                yield item
+            elif original in self.results:
+                yield self._materialize(item, self.results[original])
+            else:
+                self.waiting.setdefault(original, []).append(item)
+    
+    def finished(self, result):
+        """Record a source's result and return the results of its held-back copies."""
+        if "duplicate_of" in result:
+            return []
+        self.results[result["input"]] = {key: result[key] for key in ("input", "output", "status", "size", "error")}
+        return [self._materialize(path, result) for path in self.waiting.pop(result["input"], [])]
+    
+    def _original_of(self, path):
+        try:
+            candidates = self.by_size.setdefault(os.path.getsize(path), [])
+        except OSError:
+            return None  # Let the conversion report it
+        for candidate in candidates:
+            if (self._digest(candidate, True) == self._digest(path, True)
+                    and self._digest(candidate, False) == self._digest(path, False)):
+                return candidate
+        candidates.append(path)
+        return None
+    
+    def _digest(self, path, partial):
+        key = (path, partial)
+        if key not in self.digests:
+            self.digests[key] = _partial_digest(path) if partial else _file_digest(path)
+        return self.digests[key]
+    
+    def _materialize(self, path, original):
+        if original["status"] != "converted":
+            result = _failed_result(path, f"Identical to {original['input']}: {original['error']}")
+            result["duplicate_of"], result["link"] = original["input"], None
+            return result
+        
+        sources = original["output"] if isinstance(original["output"], list) else [original["output"]]
+        output = self.output_for(path)
+        destinations = output if isinstance(output, list) else [output]
+        try:
+            methods = [_link_or_copy(source, destination) for source, destination in zip(sources, destinations)]
+        except OSError as e:
+            result = _failed_result(path, e)
+            result["duplicate_of"], result["link"] = original["input"], None
+            return result
+        return {"input": path, "output": output, "status": "converted", "size": original["size"], "error": None,
+                "metrics": None, "duplicate_of": original["input"], "link": methods[0]}
+
+
+class _StageClock:
+    """Times consecutive conversion stages of one file for the metrics hook."""
+    
+    def __init__(self, input_path):
+        self.input_path = str(input_path)
+        self.stages = {}
+        self.input_pixels = 0
+        self.output_pixels = 0
+        self.output_bytes = 0
+        self.started = self.last = time.perf_counter()
+    
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self.last
+        self.last = now
+    
+    def add_output(self, img, output_bytes):
+        self.output_pixels += img.width * img.height
+        self.output_bytes += output_bytes
+    
+    def finish(self, status, error=None):
+        try:
+            input_bytes = os.path.getsize(self.input_path)
+        except OSError:
+            input_bytes = 0
+        return {"input": self.input_path, "status": status, "error_type": type(error).__name__ if error else None,
+                "seconds": time.perf_counter() - self.started, "stages": self.stages,
+                "input_bytes": input_bytes, "output_bytes": self.output_bytes,
+                "input_pixels": self.input_pixels, "output_pixels": self.output_pixels}
+
+
+def iter_image_files(folder_path, file_pattern="*", recursive=False, include=None, exclude=None):
+    """Yield image files in a folder as they are found, without building a list first.
+    
+    Args:
+        folder_path: Path to folder containing images
+        file_pattern: Wildcard pattern for file names (default: "*" for all files); with a "/" it is
+            matched against the path relative to the folder as Path.glob would, "**" for any subfolders
+        recursive: Also scan subfolders (default False)
+        include: Wildcard patterns; a file's relative path or name must match one (optional)
+        exclude: Wildcard patterns; matching files and folders are skipped (optional)
+    
+    Yields:
+        Path of every file with an image extension
+    """
+    root = Path(folder_path)
+    # A path-style pattern reaches into subfolders by itself, as far as its own depth
+    pattern_parts = file_pattern.split("/")
+    pattern_depth = None if "**" in pattern_parts else len(pattern_parts) - 1
+    pending_dirs = [(root, "")]  # (folder, its path relative to root with a trailing slash)
+    while pending_dirs:
+        directory, rel_dir = pending_dirs.pop()
+        try:
+            entries = os.scandir(directory)
+        except OSError:
+            continue  # Unreadable subfolder
+        
+        with entries:
+            for entry in entries:
+                rel_path = rel_dir + entry.name
+                if exclude and _matches_any(rel_path, entry.name, exclude):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive or (pattern_depth is None or rel_path.count("/") < pattern_depth):
+                        pending_dirs.append((entry.path, rel_path + "/"))
+                    continue
+                if os.path.splitext(entry.name)[1].lower() not in IMAGE_EXTENSIONS:
+                    continue
+                if not _matches_pattern(rel_path, entry.name, file_pattern):
+                    continue
+                if include and not _matches_any(rel_path, entry.name, include):
+                    continue
+                yield root / rel_path
+
+
+def count_image_files(image_files):
+    """Count a (lazy) iterable of image files without keeping it in memory."""
+    return sum(1 for _ in image_files)
+
+
+def _matches_any(rel_path, name, patterns):
+    """Check a relative path or a bare name against wildcard patterns."""
+    return any(fnmatch.fnmatch(rel_path, pattern) or fnmatch.fnmatch(name, pattern) for pattern in patterns)
+
+
+def _matches_pattern(rel_path, name, file_pattern):
+    """Match a file against `file_pattern`: by name, or by relative path when the pattern contains "/"."""
+    if "/" not in file_pattern:
+        return fnmatch.fnmatch(name, file_pattern)
+    return _matches_segments(rel_path.split("/"), file_pattern.split("/"))
+
+
+def _matches_segments(parts, patterns):
+    """Match path segments against pattern segments one by one, "**" standing for any number of folders."""
+    if not patterns:
+        return not parts
+    if patterns[0] == "**":
+        return any(_matches_segments(parts[skip:], patterns[1:]) for skip in range(len(parts) + 1))
+    return bool(parts) and fnmatch.fnmatch(parts[0], patterns[0]) and _matches_segments(parts[1:], patterns[1:])
+
+
+def _exclude_output_folder(folder_path, output_folder, recursive=False, exclude=None):
+    """Add the output folder to the exclude patterns when a recursive scan would otherwise descend into it."""
+    exclude = list(exclude or [])
+    if output_folder and recursive:
+        rel_output = os.path.relpath(output_folder, folder_path)
+        if rel_output != os.curdir and not rel_output.startswith(os.pardir):
+            exclude.append(Path(rel_output).as_posix())
+    return exclude
+
+
+def _skip_own_outputs(image_files, pipeline):
+    """Drop files that are the pipeline's own outputs, so a folder scan never re-converts them.
+    
+    Nothing is remembered per file: only a name ending in one of the
+    pipeline's output suffixes and extensions is looked at further, and it
+    is an output when a source next to it maps to it.
+    """
+    endings = [f"{suffix}.{fmt}" for fmt, _, _, _, suffix in pipeline.outputs]
+    for image_path in image_files:
+        name = os.path.basename(image_path)
+        own = any(name.endswith(ending) and len(name) > len(ending)
+                  and _is_output_of_sibling(image_path, name[:-len(ending)], pipeline) for ending in endings)
+        if not own:
+            yield image_path
+
+
+def _is_output_of_sibling(path, source_name, pipeline):
+    """Check whether a source file `source_name`.<image extension> in the same folder has `path` as an output."""
+    stem = os.path.join(os.path.dirname(path), source_name)
+    target = os.path.abspath(path)
+    for extension in IMAGE_EXTENSIONS:
+        for source in (stem + extension, stem + extension.upper()):
+            if not os.path.isfile(source):
+                continue
+            outputs = pipeline.output_for(source)
+            if target in (os.path.abspath(output) for output in (outputs if isinstance(outputs, list) else [outputs])):
+                return True
+    return False
+
+
+def _is_watched(folder_path, path, file_pattern="*", recursive=False, include=None, exclude=None):
+    """Apply the filters of `iter_image_files` to a single path reported by a filesystem event."""
+    rel_path = Path(os.path.relpath(path, folder_path)).as_posix()
+    parts = rel_path.split("/")
+    if parts[0] == os.pardir or (len(parts) > 1 and not recursive and "/" not in file_pattern):
+        return False
+    if exclude and any(_matches_any("/".join(parts[:depth]), parts[depth - 1], exclude)
+                       for depth in range(1, len(parts) + 1)):
+        return False
+    name = parts[-1]
+    if os.path.splitext(name)[1].lower() not in IMAGE_EXTENSIONS or not _matches_pattern(rel_path, name, file_pattern):
+        return False
+    return not include or _matches_any(rel_path, name, include)
+
+
+def _file_signature(path):
+    """Return (size, mtime_ns) of a file, or None if it is gone."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+
+def _file_signatures(image_files):
+    """Map each path to its (size, mtime_ns), for spotting new and changed files between scans."""
+    return {str(path): _file_signature(path) for path in image_files}
+
+
+class _WatchEvents:
+    """watchdog event handler queueing the path of every created, modified or moved-in file or folder."""
+    
+    def __init__(self, events):
+        self.events = events
+    
+    def dispatch(self, event):
+        if event.event_type in ("created", "modified", "moved", "closed"):
+            if event.is_directory and event.event_type == "modified":
+                return  # A folder's listing changed; its files report themselves
+            self.events.put(os.fsdecode(getattr(event, "dest_path", "") or event.src_path))
+
+
+def _convert_chunk(pipeline, image_paths, collect_metrics=False, resize_mode=None, quality_hints=None):
+    """Convert a chunk of images inside a worker process."""
+    quality_hints = quality_hints or [None] * len(image_paths)
+    return [pipeline.convert(path, collect_metrics, resize_mode, hint) for path, hint in zip(image_paths, quality_hints)]
+
+
+def _normalize_targets(targets, output_format=None, max_width=None, quality=85):
+    """Turn output specs into (format, width, quality) tuples, filling in the defaults."""
+    normalized = []
+    for target in targets:
+        if isinstance(target, str):
+            fmt, width, target_quality = target, max_width, quality
+        elif isinstance(target, dict):
+            fmt = target.get("format", output_format)
+            width = target.get("width", max_width)
+            target_quality = target.get("quality", quality)
+        else:
+            defaults = (output_format, max_width, quality)
+            fmt, width, target_quality = tuple(target) + defaults[len(target):]
+        if not fmt:
+            raise ValueError(f"Output spec {target!r} has no format")
+        normalized.append((fmt.lower(), width if width and isinstance(width, int) else None, target_quality))
+    if not normalized:
+        raise ValueError("At least one output spec is required")
+    return normalized
+
+
+def _check_output(output_format, width, quality):
+    """Raise ValueError for a format Pillow cannot write, a width below 1 or a quality outside 1-100."""
+    if _pillow_format(output_format) not in Image.SAVE:  # _pillow_format has loaded Pillow's plugins
+        raise ValueError(f"Unsupported output format {output_format!r}")
+    if width is not None and (not isinstance(width, int) or width < 1):
+        raise ValueError(f"Width must be a positive number of pixels, got {width!r}")
+    if quality is not None and (not isinstance(quality, int) or not 1 <= quality <= 100):
+        raise ValueError(f"Quality must be between 1 and 100, got {quality!r}")
+
+
+def _failed_result(input_path, error, clock=None):
+    """Build the result dict for a conversion that raised."""
+    return {"input": str(input_path), "output": None, "status": "failed", "size": None, "error": str(error),
+            "metrics": clock.finish("failed", error) if clock else None}
+
+
+def _output_path(input_path, output_format, output_folder=None, suffix="_converted", source_root=None):
+    """Return the `<name>_converted.<fmt>` path for an input file.
+    
+    With a source_root, the file's subfolder below it is mirrored under output_folder.
+    """
+    file_name, _ = os.path.splitext(str(input_path))
+    base_name = os.path.basename(file_name)
+    
+    if output_folder and source_root:
+        rel_dir = os.path.relpath(os.path.dirname(os.path.abspath(input_path)), os.path.abspath(source_root))
+        output_folder = os.path.normpath(os.path.join(output_folder, rel_dir))
+    if output_folder:
+        return os.path.join(output_folder, f"{base_name}{suffix}.{output_format.lower()}")
+    return f"{file_name}{suffix}.{output_format.lower()}"
+
+
+def _pillow_format(output_format):
+    """Return Pillow's format name for an extension-style format (e.g. jpg -> JPEG)."""
+    return Image.registered_extensions().get(f".{output_format.lower()}", output_format.upper())
+
+
+def _stage_name(stage):
+    """Describe a pipeline stage for the manifest key, so changing stages reconverts."""
+    if isinstance(stage, functools.partial):
+        options = ", ".join([repr(arg) for arg in stage.args] + [f"{key}={value!r}" for key, value in
+                                                                  sorted(stage.keywords.items())])
+        return f"{_stage_name(stage.func)}({options})"
+    return getattr(stage, "__qualname__", repr(stage))
+
+
+def _save_kwargs(output_format, quality, profile=None):
+    """Return the Pillow save options for the target format and encoder profile."""
+    save_kwargs = dict(ENCODER_PROFILES[profile].get(_pillow_format(output_format), {})) if profile else {}
+    if output_format.lower() in ['jpg', 'jpeg', 'webp']:
+        save_kwargs['quality'] = min(100, max(1, int(quality)))  # Clamp quality to 1-100
+    return save_kwargs
+
+
+def load_manifest(manifest_path):
+    """Load the conversion manifest, or start an empty one if it is missing or unreadable.
+    
+    The manifest maps a conversion key (input path, output format, max_width,
+    quality, resize mode) to the source size/mtime (and optional content hash)
+    it was produced from, plus the output path.
+    """
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get("version") != MANIFEST_VERSION:
+        return {}
+    return data.get("entries", {})
+
+
+def save_manifest(manifest_path, manifest):
+    """Write the manifest atomically (temp file + rename) so a crash never truncates it."""
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+    os.makedirs(manifest_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".manifest-", suffix=".tmp", dir=manifest_dir)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "entries": manifest}, f)
+        os.replace(tmp_path, manifest_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def evict_manifest(manifest):
+    """Drop entries whose source file no longer exists. Returns the number removed."""
+    stale = [key for key, entry in manifest.items() if not os.path.exists(entry["input"])]
+    for key in stale:
+        del manifest[key]
+    return len(stale)
+
+
+def _skip_up_to_date(image_files, manifest, cache_check, signatures, settings, output_for):
+    """Yield a "skipped" result for up-to-date files and the path of every file that needs converting.
+    
+    `settings` is the JSON-able list of conversion options that ends up in the
+    manifest key and `output_for` maps an input to its output path(s). The
+    source signature of each file to convert is stored in `signatures`, so
+    the manifest records the state the output was actually built from.
+    """
+    for image_path in image_files:
+        input_path = os.path.abspath(image_path)
+        output_path = output_for(image_path)
+        key = json.dumps([input_path] + settings)
+        try:
+            stat = os.stat(input_path)
+        except OSError:
+            yield str(image_path)  # Let the conversion report the error
+            continue
+        
+        signature = {"input": input_path, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+        entry = manifest.get(key)
+        if entry and entry["output"] == output_path and entry["size"] == stat.st_size and _outputs_exist(output_path):
+            if entry["mtime_ns"] == stat.st_mtime_ns:
+                yield _skipped_result(image_path, output_path)
+                continue
+            if cache_check == "hash" and entry.get("sha256") == _file_digest(input_path):
+                entry["mtime_ns"] = stat.st_mtime_ns  # Touched but unchanged
+                yield _skipped_result(image_path, output_path)
+                continue
+        
+        if cache_check == "hash":
+            signature["sha256"] = _file_digest(input_path)
+        signatures[str(image_path)] = (key, signature)
+        yield str(image_path)
+
+
+def _outputs_exist(output_path):
+    """Check that an output path (or every path of a variant list) exists."""
+    if isinstance(output_path, list):
+        return all(os.path.exists(path) for path in output_path)
+    return os.path.exists(output_path)
+
+
+def _skipped_result(input_path, output_path):
+    """Build the result dict for a file whose output is already up to date."""
+    return {"input": str(input_path), "output": output_path, "status": "skipped", "size": None, "error": None,
+            "metrics": None}
+
+
+def _file_digest(path, block_size=1 << 20):
+    """Return the SHA-256 hex digest of a file, read in 1 MiB blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _partial_digest(path):
+    """Return the SHA-256 hex digest of a file's first and last 64 KiB, a cheap first check for equality."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        digest.update(f.read(_PARTIAL_HASH_BYTES))
+        f.seek(max(0, os.fstat(f.fileno()).st_size - _PARTIAL_HASH_BYTES))
+        digest.update(f.read(_PARTIAL_HASH_BYTES))
+    return digest.hexdigest()
+
+
+def _link_or_copy(source, destination):
+    """Make destination a reflink of source, else a hardlink, else a copy.
+    
+    Returns:
+        The method used, or "same" when both names are one path and nothing was done
+    """
+    if os.path.abspath(source) == os.path.abspath(destination):
+        return "same"
+    folder = os.path.dirname(destination) or "."
+    os.makedirs(folder, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=folder, prefix=".pixelforge-", suffix=".tmp")
+    try:
+        method = None
+        if fcntl is not None:
+            try:
+                with open(source, "rb") as src:
+                    fcntl.ioctl(fd, _FICLONE, src.fileno())
+                method = "reflink"
+            except OSError:
+                pass  # Not supported by this filesystem
+        os.close(fd)
+        fd = None
+        if method is None:
+            os.remove(temp_path)
+            try:
+                os.link(source, temp_path)
+                method = "hardlink"
+            except OSError:
+                shutil.copyfile(source, temp_path)
+                method = "copy"
+        os.replace(temp_path, destination)
+    except BaseException:
+        if fd is not None:
+            os.close(fd)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return method
+
+
+@contextlib.contextmanager
+def _atomic_output(destination):
+    """Yield where to write an output file: a temp file next to it, renamed over it once complete.
+    
+    A crash or kill mid-encode thus never leaves a truncated output behind,
+    only a hidden ".<name>.tmp" file that the next conversion of the same
+    output overwrites, and replacing the name never writes through a hardlink
+    to a deduplicated copy. File objects are yielded as they are.
+    """
+    if not isinstance(destination, (str, os.PathLike)):
+        yield destination
+        return
+    destination = os.fspath(destination)
+    folder, name = os.path.split(destination)
+    temp_path = os.path.join(folder, f".{name}.tmp")
+    try:
+        yield temp_path
+        os.replace(temp_path, destination)
+    except BaseException as e:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        if isinstance(e, OSError) and e.filename == temp_path:
+            e.filename = destination  # Report the output, e.g. a missing output folder, not the temp name
+        raise
+
+
+def _format_quality_target(max_bytes=None, min_ssim=None):
+    """Describe a quality search target, e.g. "≤200 KB, SSIM≥0.98"."""
+    parts = []
+    if max_bytes:
+        parts.append(f"≤{max_bytes / 1024:.0f} KB")
+    if min_ssim:
+        parts.append(f"SSIM≥{min_ssim}")
+    return ", ".join(parts)
+
+
+def _format_duration(seconds):
+    """Format a duration as m:ss (or h:mm:ss)."""
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+def _quiet(*args, **kwargs):
+    """Stand-in for print when a batch runs with verbose=False."""
+
+
+def _print_result(result, output_format, max_width=None, quality=85):
+    """Print the ✓/✗ line for a conversion result (output_format is None for variant results)."""
+    if isinstance(result["output"], list):
+        names = ", ".join(os.path.basename(path) for path in result["output"])
+    else:
+        names = os.path.basename(result["output"] or "")
+    
+    if result["status"] == "skipped":
+        print(f"↷ Up to date: {os.path.basename(result['input'])} → {names}")
+        return
+    if result.get("link"):
+        how = "same output as" if result["link"] == "same" else f"{result['link']} of"
+        print(f"⧉ Duplicate: {os.path.basename(result['input'])} → {names} "
+              f"({how} {os.path.basename(result['duplicate_of'])})")
+        return
+    if result["status"] != "converted":
+        print(f"✗ Error converting {result['input']}: {result['error']}")
+        return
+    if output_format is None:
+        sizes = ", ".join(f"{width}x{height}" for width, height in result["size"])
+        print(f"✓ Converted: {os.path.basename(result['input'])} → {names} ({sizes})")
+        return
+    
+    width, height = result["size"]
+    size_info = f" ({width}x{height})" if max_width else ""
+    quality_info = f" [Q:{quality}]" if output_format.lower() in ['jpg', 'jpeg', 'webp'] else ""
+    if result.get("quality"):
+        missed = "" if result["target_met"] else ", target missed"
+        quality_info = f" [Q:{result['quality']} searched{missed}]"
+    print(f"✓ Converted: {os.path.basename(result['input'])} → {os.path.basename(result['output'])}{size_info}{quality_info}")
+
+
+def _resize_image(img, max_width, resize_mode="exact"):
+    """Resize image maintaining aspect ratio.
+    
+    In "fast" mode a JPEG is decoded straight at a reduced scale (draft/DCT
+    scaling) and the result is box-reduced close to the target before the
+    final LANCZOS pass. Draft only works before the pixels are loaded, so
+    call this right after `Image.open`.
+    """
+    if resize_mode not in RESIZE_MODES:
+        raise ValueError(f"resize_mode must be one of {RESIZE_MODES}, got {resize_mode!r}")
+    
     if img.width <= max_width:
         return img  # No resize needed if smaller than max_width
     
@@ -107,9 +2493,403 @@ def _resize_image(img, max_width):
     ratio = max_width / img.width
     new_height = int(img.height * ratio)
     
+    if resize_mode == "fast":
+        _draft(img, max_width)
+        return img.resize((max_width, new_height), Image.Resampling.LANCZOS, reducing_gap=2.0)
+    
     return img.resize((max_width, new_height), Image.Resampling.LANCZOS)
 
 
+def _fit_frame(frame, size):
+    """Scale a frame into `size` keeping its aspect ratio, centered on an empty (transparent or black) canvas."""
+    scale = min(size[0] / frame.width, size[1] / frame.height)
+    fitted = frame.resize((max(1, round(frame.width * scale)), max(1, round(frame.height * scale))),
+                          Image.Resampling.LANCZOS)
+    canvas = Image.new(fitted.mode, size)
+    canvas.paste(fitted, ((size[0] - fitted.width) // 2, (size[1] - fitted.height) // 2))
+    return canvas
+
+
+def _draft(img, max_width):
+    """Let the JPEG decoder pick the smallest 1/2, 1/4 or 1/8 scale still >= max_width (no-op for other formats)."""
+    new_height = max(1, int(img.height * max_width / img.width))
+    img.draft(img.mode, (max_width, new_height))
+
+
+def _decode(img, max_width=None, resize_mode="exact"):
+    """Load the pixels, decoding straight at a reduced scale in fast mode."""
+    if max_width and resize_mode == "fast" and img.width > max_width:
+        _draft(img, max_width)
+    img.load()
+
+
+def main(argv=None):
+    """Command-line entry point, see `python cli.py --help`.
+    
+    Every input file or folder is converted with the options given as flags.
+    A --job file lists many such specs at once; the flags then act as defaults
+    for each of them. With --ndjson nothing but JSON events is written to
+    stdout, one per line: job_start, result (one per file), job_end with the
+    counts and throughput, and a final summary.
+    
+    With --watch the single folder given is converted and then watched: new
+    and changed images are converted as they settle, until Ctrl+C or SIGTERM.
+    
+    Args:
+        argv: Argument list (default: sys.argv[1:])
+    
+    Returns:
+        Exit code: EXIT_OK, EXIT_FAILED, EXIT_USAGE, EXIT_NO_IMAGES or EXIT_INTERRUPTED
+    """
+    args = _build_parser().parse_args(argv)
+    emit = _emit_event if args.ndjson else None
+    
+    try:
+        jobs = _load_jobs(args)
+    except (OSError, ValueError) as e:
+        if emit:
+            emit({"event": "error", "error": str(e), "exit_code": EXIT_USAGE})
+        else:
+            print(f"Error: {e}", file=sys.stderr)
+        return EXIT_USAGE
+    
+    if args.watch:
+        return _watch_job(jobs, args, emit)
+    
+    totals = dict.fromkeys(("converted", "skipped", "failed", "deduplicated"), 0)
+    started = time.perf_counter()
+    try:
+        for number, job in enumerate(jobs, 1):
+            for status, count in _run_job(number, job, emit, args.metrics).items():
+                totals[status] += count
+    except KeyboardInterrupt:
+        if emit:
+            emit({"event": "interrupted", **totals, "exit_code": EXIT_INTERRUPTED})
+        else:
+            print("\nInterrupted", file=sys.stderr)
+        return EXIT_INTERRUPTED
+    
+    if totals["failed"]:
+        exit_code = EXIT_FAILED
+    elif not totals["converted"] and not totals["skipped"]:
+        exit_code = EXIT_NO_IMAGES
+    else:
+        exit_code = EXIT_OK
+    
+    seconds = time.perf_counter() - started
+    if emit:
+        emit({"event": "summary", "jobs": len(jobs), **totals, "seconds": round(seconds, 3),
+              "images_per_sec": round(totals["converted"] / seconds, 3) if seconds else None,
+              "exit_code": exit_code})
+    elif len(jobs) > 1:
+        print(f"\nAll {len(jobs)} jobs done in {seconds:.1f}s: "
+              f"✓ {totals['converted']} converted, ↷ {totals['skipped']} skipped, ✗ {totals['failed']} failed")
+    return exit_code
+
+
+def _build_parser():
+    """Return the argument parser of `main`."""
+    parser = argparse.ArgumentParser(
+        prog="cli.py",
+        description="PixelForge - convert, resize and compress images.",
+        epilog="Exit codes: 0 ok, 1 some files failed, 2 usage error, 3 no images found, 130 interrupted.")
+    parser.add_argument("inputs", nargs="*", metavar="INPUT", help="Image files and/or folders to convert")
+    parser.add_argument("-f", "--format", help="Output format (png, jpg, jpeg, webp, bmp, ico)")
+    parser.add_argument("-w", "--max-width", type=int, help="Maximum width in pixels (aspect ratio is kept)")
+    parser.add_argument("-q", "--quality", type=int, default=85, help="Quality for JPEG/WebP, 1-100 (default 85)")
+    parser.add_argument("-o", "--output-folder", help="Output folder (default: next to each source)")
+    parser.add_argument("-p", "--pattern", default="*", help='Wildcard for files in input folders (default "*")')
+    parser.add_argument("-r", "--recursive", action="store_true", help="Also convert subfolders, mirroring them")
+    parser.add_argument("--include", action="append", metavar="PATTERN", help="Only files matching (repeatable)")
+    parser.add_argument("--exclude", action="append", metavar="PATTERN",
+                        help="Skip files and folders matching (repeatable)")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="Worker processes (default 1 = in-process, 0 = one per CPU core)")
+    parser.add_argument("--chunk-size", type=int, default=8, help="Files handed to a worker at a time (default 8)")
+    parser.add_argument("--resize-mode", choices=RESIZE_MODES, default="exact",
+                        help="exact (full decode + LANCZOS) or fast (draft decode + reducing_gap)")
+    parser.add_argument("--manifest", metavar="PATH", help="Manifest of completed conversions; up-to-date ones are skipped")
+    parser.add_argument("--cache-check", choices=CACHE_CHECKS, default="mtime",
+                        help="How the manifest detects changed sources (default mtime)")
+    parser.add_argument("-t", "--target", action="append", dest="targets", metavar="FORMAT[:WIDTH[:QUALITY]]",
+                        help="Also write this variant from the same decode (repeatable), e.g. webp:1080")
+    parser.add_argument("--memory-budget", metavar="SIZE",
+                        help="Cap on decoded pixels in flight across workers, e.g. 2G or 512M")
+    parser.add_argument("--preflight", action="store_true",
+                        help="Probe every header first: reject unreadable files, convert largest first, pixel-based ETA")
+    parser.add_argument("--probe-index", metavar="PATH",
+                        help="SQLite file keeping header probes between runs (implies --preflight)")
+    parser.add_argument("--journal", metavar="PATH",
+                        help="Write-ahead journal of the folder batch; rerunning after a crash resumes from it")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Convert byte-identical sources once, linking or copying the output for the rest")
+    parser.add_argument("--max-bytes", metavar="SIZE",
+                        help="Search the highest JPEG/WebP quality that fits, e.g. 200K (see --manifest to reuse it)")
+    parser.add_argument("--min-ssim", type=float, metavar="SSIM",
+                        help="Search the lowest JPEG/WebP quality reaching this SSIM, e.g. 0.98")
+    parser.add_argument("--profile", choices=tuple(ENCODER_PROFILES),
+                        help="Encoder settings: fastest, balanced or smallest (default: Pillow's defaults)")
+    parser.add_argument("--srgb", action="store_true", help="Convert pixels from an embedded ICC profile to sRGB")
+    parser.add_argument("--sharpen", action="store_true", help="Unsharp mask after resizing")
+    parser.add_argument("--strip-metadata", action="store_true", help="Drop EXIF, XMP and ICC profile from outputs")
+    parser.add_argument("--no-count", dest="count", action="store_false",
+                        help="Start converting while folders are still being scanned (no [n/total])")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep watching the input folder, converting new and changed images as they arrive")
+    parser.add_argument("--settle", type=float, default=WATCH_SETTLE_SECONDS, metavar="SECONDS",
+                        help="With --watch: seconds a file must stay unchanged before it is converted (default 1)")
+    parser.add_argument("--poll", type=float, metavar="SECONDS",
+                        help="With --watch: rescan every SECONDS instead of using filesystem events")
+    parser.add_argument("--job", metavar="FILE", help="JSON job file listing many input/output specs")
+    parser.add_argument("--ndjson", action="store_true", help="Write JSON progress/result events to stdout")
+    parser.add_argument("--metrics", action="store_true", help="Collect per-stage timings for every job")
+    return parser
+
+
+def _load_jobs(args):
+    """Build the list of job dicts from the parsed arguments and the optional --job file.
+    
+    The job file holds a list of specs, or {"defaults": {...}, "jobs": [...]}.
+    Spec keys are the long option names with underscores (see JOB_KEYS), and
+    "input" may be a single path or a list of paths.
+    """
+    defaults = {"format": args.format, "max_width": args.max_width, "quality": args.quality,
+                "output_folder": args.output_folder, "pattern": args.pattern, "recursive": args.recursive,
+                "include": args.include, "exclude": args.exclude, "resize_mode": args.resize_mode,
+                "manifest": args.manifest, "cache_check": args.cache_check, "targets": args.targets,
+                "memory_budget": args.memory_budget, "workers": args.workers, "chunk_size": args.chunk_size,
+                "count": args.count, "dedup": args.dedup, "srgb": args.srgb, "sharpen": args.sharpen,
+                "strip_metadata": args.strip_metadata, "max_bytes": args.max_bytes, "min_ssim": args.min_ssim,
+                "profile": args.profile, "preflight": args.preflight, "probe_index": args.probe_index,
+                "journal": args.journal}
+    specs = [{"input": args.inputs}] if args.inputs else []
+    
+    if args.job:
+        with open(args.job, encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            defaults.update(_check_job_keys(data.get("defaults", {}), f"{args.job} defaults"))
+            data = data.get("jobs")
+        if not isinstance(data, list):
+            raise ValueError(f'{args.job}: expected a list of jobs or {{"jobs": [...]}}')
+        specs.extend(data)
+    
+    if not specs:
+        raise ValueError("No input given (pass files/folders or --job FILE)")
+    
+    jobs = []
+    for number, spec in enumerate(specs, 1):
+        job = {**defaults, **_check_job_keys(spec, f"job {number}")}
+        for key in ("input", "include", "exclude", "targets"):
+            if isinstance(job.get(key), str):
+                job[key] = [job[key]]
+        if not job.get("input"):
+            raise ValueError(f"job {number}: no input given")
+        if job["targets"]:
+            job["targets"] = [_parse_target(target) if isinstance(target, str) else target
+                              for target in job["targets"]]
+            try:
+                # Every target needs a format, its own or --format
+                for target in _normalize_targets(job["targets"], job["format"], job["max_width"], job["quality"]):
+                    _check_output(*target)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"job {number}: invalid targets: {e}") from None
+        elif not job["format"]:
+            raise ValueError(f"job {number}: no output format given (--format or --target)")
+        else:
+            try:
+                _check_output(job["format"], job["max_width"], job["quality"])
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"job {number}: {e}") from None
+        if job["resize_mode"] not in RESIZE_MODES:
+            raise ValueError(f"job {number}: resize_mode must be one of {RESIZE_MODES}")
+        if job["cache_check"] not in CACHE_CHECKS:
+            raise ValueError(f"job {number}: cache_check must be one of {CACHE_CHECKS}")
+        if job["profile"] and job["profile"] not in ENCODER_PROFILES:
+            raise ValueError(f"job {number}: profile must be one of {tuple(ENCODER_PROFILES)}")
+        if job["probe_index"]:
+            try:
+                ProbeIndex.check(job["probe_index"])
+            except (OSError, ValueError) as e:
+                raise ValueError(f"job {number}: {e}") from None
+        if job["journal"] and (len(job["input"]) != 1 or not os.path.isdir(job["input"][0])):
+            raise ValueError(f"job {number}: a journal needs exactly one input folder")
+        for key in ("memory_budget", "max_bytes"):
+            if job[key] is not None:
+                job[key] = _parse_size(job[key])
+        job["workers"] = job["workers"] or None  # 0 means one per CPU core
+        jobs.append(job)
+    return jobs
+
+
+def _check_job_keys(spec, where):
+    """Return spec if it is a dict with known keys only."""
+    if not isinstance(spec, dict):
+        raise ValueError(f"{where}: expected an object, got {spec!r}")
+    unknown = sorted(set(spec) - set(JOB_KEYS))
+    if unknown:
+        raise ValueError(f"{where}: unknown key(s) {', '.join(unknown)}")
+    return spec
+
+
+def _parse_target(text):
+    """Parse a FORMAT[:WIDTH[:QUALITY]] variant spec into a dict for _normalize_targets."""
+    fmt, width, quality = (text.split(":") + ["", ""])[:3]
+    target = {"format": fmt} if fmt else {}
+    try:
+        if width and width.lower() != "none":
+            target["width"] = int(width)
+        if quality:
+            target["quality"] = int(quality)
+    except ValueError:
+        raise ValueError(f"Invalid target {text!r}, expected FORMAT[:WIDTH[:QUALITY]]") from None
+    return target
+
+
+def _parse_size(value):
+    """Parse a byte count such as 2G, 512M, 1.5GiB or 1048576 (units are powers of 1024)."""
+    if isinstance(value, int):
+        return value
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)(?:i?B)?\s*", str(value), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid size {value!r}, expected e.g. 2G or 512M")
+    number, unit = match.groups()
+    return int(float(number) * 1024 ** " KMGT".index(unit.upper() or " "))
+
+
+def _run_job(number, job, emit=None, collect_metrics=False):
+    """Convert every input of one job, returning its converted/skipped/failed/deduplicated counts."""
+    counts = dict.fromkeys(("converted", "skipped", "failed", "deduplicated"), 0)
+    metrics = BatchMetrics() if collect_metrics else None
+    stages = _job_stages(job)
+    options = {"workers": job["workers"], "chunk_size": job["chunk_size"], "cache_check": job["cache_check"],
+               "metrics": metrics, "memory_budget": job["memory_budget"], "dedup": job["dedup"]}
+    output_format = None if job["targets"] else job["format"]
+    if job["output_folder"]:
+        os.makedirs(job["output_folder"], exist_ok=True)
+    started = time.perf_counter()
+    if emit:
+        emit({"event": "job_start", "job": number, "inputs": job["input"], "format": job["format"],
+              "targets": job["targets"], "output_folder": job["output_folder"]})
+    
+    def on_result(result, done, total):
+        counts[result["status"]] += 1
+        if result.get("link"):
+            counts["deduplicated"] += 1
+        if emit:
+            emit({"event": "result", "job": number, "done": done, "total": total, **result})
+    
+    files = []
+    for input_path in job["input"]:
+        if os.path.isdir(input_path):
+            batch_convert_images(input_path, job["format"], job["pattern"], job["max_width"], job["quality"],
+                                 job["output_folder"], resize_mode=job["resize_mode"], manifest_path=job["manifest"],
+                                 targets=job["targets"], recursive=job["recursive"], include=job["include"],
+                                 exclude=job["exclude"], show_total=job["count"], on_result=on_result,
+                                 verbose=emit is None, stages=stages, max_bytes=job["max_bytes"],
+                                 min_ssim=job["min_ssim"], profile=job["profile"], preflight=job["preflight"],
+                                 probe_index_path=job["probe_index"], journal_path=job["journal"], **options)
+        elif os.path.isfile(input_path):
+            files.append(input_path)
+        else:
+            result = _failed_result(input_path, "No such file or directory")
+            if emit is None:
+                _print_result(result, output_format)
+            on_result(result, None, None)
+    
+    # Loose files share one pass so they are spread over the workers too
+    if files:
+        manifest = load_manifest(job["manifest"]) if job["manifest"] else None
+        probe_index = ProbeIndex(job["probe_index"] or ":memory:") if job["preflight"] or job["probe_index"] else None
+        try:
+            pipeline = _job_pipeline(job)
+            results = iter_convert_images(files, manifest=manifest, pipeline=pipeline, probe_index=probe_index,
+                                          **options)
+            for done, result in enumerate(results, 1):
+                if emit is None:
+                    _print_result(result, output_format, job["max_width"], job["quality"])
+                on_result(result, done, len(files))
+        finally:
+            if manifest is not None:
+                save_manifest(job["manifest"], manifest)
+            if probe_index is not None:
+                probe_index.close()
+    
+    if emit:
+        seconds = time.perf_counter() - started
+        event = {"event": "job_end", "job": number, **counts, "seconds": round(seconds, 3),
+                 "images_per_sec": round(counts["converted"] / seconds, 3) if seconds else None}
+        if metrics is not None:
+            event["metrics"] = metrics.summary()
+        emit(event)
+    elif metrics is not None and files:
+        print(f"⏱ Stage time: {metrics.format_stages()}")
+    return counts
+
+
+def _job_stages(job):
+    """Return the pipeline stages a job's srgb/sharpen/strip_metadata switches ask for."""
+    return [stage for key, stage in (("srgb", convert_to_srgb), ("sharpen", sharpen),
+                                     ("strip_metadata", strip_metadata)) if job[key]]
+
+
+def _job_pipeline(job, source_root=None):
+    """Build the ConversionPipeline for a job's conversion settings."""
+    return ConversionPipeline(job["format"], job["max_width"], job["quality"], job["output_folder"],
+                              job["resize_mode"], job["targets"], source_root, stages=_job_stages(job),
+                              max_bytes=job["max_bytes"], min_ssim=job["min_ssim"], profile=job["profile"])
+
+
+def _watch_job(jobs, args, emit=None):
+    """Run the single folder job of --watch until Ctrl+C or SIGTERM, returning the exit code."""
+    job = jobs[0]
+    if len(jobs) != 1 or len(job["input"]) != 1 or not os.path.isdir(job["input"][0]):
+        error = "--watch needs exactly one input folder"
+        if emit:
+            emit({"event": "error", "error": error, "exit_code": EXIT_USAGE})
+        else:
+            print(f"Error: {error}", file=sys.stderr)
+        return EXIT_USAGE
+    
+    folder = job["input"][0]
+    if job["output_folder"]:
+        os.makedirs(job["output_folder"], exist_ok=True)
+    counts = dict.fromkeys(("converted", "skipped", "failed"), 0)
+    if emit:
+        emit({"event": "job_start", "job": 1, "inputs": job["input"], "format": job["format"],
+              "targets": job["targets"], "output_folder": job["output_folder"], "watch": True})
+    
+    def on_result(result, done, total):
+        counts[result["status"]] += 1
+        if emit:
+            emit({"event": "result", "job": 1, "done": done, "total": total, **result})
+    
+    # A service manager stops the watch with SIGTERM; finish the current file and save the manifest first
+    stop_event = threading.Event()
+    previous_handler = signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    started = time.perf_counter()
+    try:
+        watch_folder(folder, file_pattern=job["pattern"], workers=job["workers"], recursive=job["recursive"],
+                     include=job["include"], exclude=job["exclude"], manifest_path=job["manifest"],
+                     cache_check=job["cache_check"], memory_budget=job["memory_budget"],
+                     pipeline=_job_pipeline(job, folder if job["recursive"] else None), settle_seconds=args.settle,
+                     poll_interval=args.poll, on_result=on_result, verbose=emit is None, stop_event=stop_event)
+    finally:
+        signal.signal(signal.SIGTERM, previous_handler)
+    
+    exit_code = EXIT_FAILED if counts["failed"] else EXIT_OK
+    if emit:
+        seconds = time.perf_counter() - started
+        emit({"event": "summary", "jobs": 1, **counts, "seconds": round(seconds, 3), "exit_code": exit_code})
+    return exit_code
+
+
+def _emit_event(event):
+    """Write one NDJSON event to stdout, flushed so a reading process sees it right away."""
+    sys.stdout.write(json.dumps(event, ensure_ascii=False, default=str) + "\n")
+    sys.stdout.flush()
+
+
 # Example Usage:
 # Single image conversion
 # convert_image("my_photo.jpg", "png")
@@ -124,4 +2904,78 @@ def _resize_image(img, max_width):
 # batch_convert_images("./images", "webp")
 
 # Batch conversion with all options
-# batch_convert_images("./images", "jpg", "*.png", max_width=1080, quality=90, output_folder="./output")
\ No newline at end of file
+# batch_convert_images("./images", "jpg", "*.png", max_width=1080, quality=90, output_folder="./output")
+
+# Batch conversion on every CPU core
+# batch_convert_images("./images", "webp", max_width=1080, workers=None)
+
+# Recursive batch, streaming files to the workers as they are found
+# batch_convert_images("./archive", "webp", recursive=True, exclude=["thumbs", "*.tmp"], output_folder="./output", show_total=False)
+
+# Incremental batch: reruns only reconvert new or changed files
+# batch_convert_images("./images", "webp", output_folder="./output", manifest_path="./output/.pixelforge-manifest.json")
+
+# Responsive variants: decode once, write WEBP at 1920/1080/640px plus a JPEG fallback
+# convert_image_variants("my_photo.jpg", [("webp", 1920), ("webp", 1080), ("webp", 640), ("jpeg", 1080, 80)])
+# batch_convert_images("./images", "webp", targets=[{"width": 1920}, {"width": 640}, {"format": "jpeg", "width": 1080}])
+
+# One pipeline for a whole job, with extra stages after the resize
+# pipeline = ConversionPipeline("webp", 1080, 80, "./output", stages=[convert_to_srgb, functools.partial(sharpen, percent=120), strip_metadata])
+# for result in iter_convert_images(paths, workers=None, pipeline=pipeline): ...
+
+# Quality by target instead of a fixed number: under 200 KB, or SSIM >= 0.98 (chosen quality in each result)
+# convert_image("my_photo.jpg", "webp", max_width=1920, max_bytes=200 * 1024)
+# batch_convert_images("./images", "jpeg", min_ssim=0.98, manifest_path="./images/.pixelforge-manifest.json")
+
+# Encoder profiles: optimized progressive JPEG / WebP method 6 / PNG level 9, or the fastest encodes
+# batch_convert_images("./images", "webp", max_width=1080, profile="smallest")
+# convert_image("screenshot.png", "png", profile="fastest")
+
+# Plan a big mixed batch from header probes (kept in SQLite between runs): bad files fail up front, largest first
+# batch_convert_images("./scans", "jpeg", max_width=1920, workers=None, probe_index_path="./scans/.pixelforge-probes.db")
+# with ProbeIndex("./probes.db") as index: print(index.probe("my_photo.jpg"))
+
+# Animated stickers and multi-page scans keep every frame (GIF/WebP/TIFF outputs)
+# batch_convert_images("./stickers", "webp", "*.gif", max_width=512)
+
+# Estimate an output before converting: only the first preview decodes the image
+# previews = PreviewCache()
+# print(previews.preview("my_photo.jpg", ConversionPipeline("webp", 1080, 75))["bytes"])
+
+# Per-stage timings for a batch
+# metrics = BatchMetrics()
+# batch_convert_images("./images", "webp", max_width=1080, metrics=metrics)
+# print(metrics.summary())
+
+# Upload folders full of identical files: convert each distinct source once
+# batch_convert_images("./uploads", "webp", max_width=1080, output_folder="./output", dedup=True)
+
+# Mixed corpus with huge TIFFs/panoramas: keep decoded pixels in flight under ~2 GB
+# batch_convert_images("./scans", "jpeg", max_width=1920, workers=None, memory_budget=2 * 1024**3)
+
+# In memory: bytes in, bytes out (or into a caller-supplied buffer / file object)
+# webp_bytes = convert_image_bytes(open("my_photo.jpg", "rb").read(), "webp", max_width=1080)
+# size = convert_image_bytes(memoryview(data), "jpeg", quality=80, out=preallocated_bytearray)
+
+# From an async service (no temp files for in-memory images)
+# webp_bytes = await convert_image_async(request_body, "webp", max_width=1080)
+# async for result in iter_convert_images_async(paths, "webp", max_pending=16): ...
+
+# Fast thumbnails from large JPEGs (draft decode + reducing_gap)
+# batch_convert_images("./photos", "webp", "*.jpg", max_width=640, resize_mode="fast")
+
+# Multi-hour batch that may be killed: rerunning the same call resumes from the journal
+# batch_convert_images("./archive", "webp", max_width=1920, output_folder="./web", workers=None,
+#                      journal_path="./web/.pixelforge-journal.ndjson")
+
+# Watch a drop folder: convert what is there, then each new or changed image once it has finished copying
+# watch_folder("./incoming", "webp", max_width=1080, output_folder="./output", workers=None,
+#              manifest_path="./incoming/.pixelforge-manifest.json")
+
+# From the command line (see python cli.py --help)
+# python cli.py ./images -f webp -w 1080 -j 0 --recursive -o ./output
+# python cli.py ./incoming -f webp -w 1080 -o ./output --watch --manifest ./incoming/.pixelforge-manifest.json
+# python cli.py --job jobs.json --ndjson > events.ndjson
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
@@ -1,9 +1,20 @@
 import customtkinter as ctk
 from tkinter import filedialog, messagebox
-from PIL import Image
+import functools
+import importlib
 import os
-from pathlib import Path
+import queue
 import threading
+import time
+
+# cli (and with it Pillow's codecs, sqlite3 and asyncio) is imported where it is first used, so the window
+# opens without waiting for it; _preload_cli starts importing it in the background once the window is up
+
+PROGRESS_REFRESH_MS = 100  # Worker events are applied to the widgets at most this often
+PREVIEW_DELAY_MS = 150  # Quiet time after the last settings change before the preview is rendered again
+PREVIEW_DISPLAY_SIZE = 240  # Longest side of the preview image on screen
+ENCODER_PROFILE_NAMES = ("fastest", "balanced", "smallest")  # cli.ENCODER_PROFILES, without importing cli
+IMAGE_FILETYPES = [("Image Files", "*.jpg *.jpeg *.png *.webp *.bmp *.ico *.gif *.tiff")]
 
 # Set appearance mode and color theme
 ctk.set_appearance_mode("dark")
@@ -15,13 +26,33 @@ class ImageConverterApp(ctk.CTk):
         
         # Window setup
         self.title("Image Converter")
-        self.geometry("1000x700")
+        self.geometry("1280x700")
         self.resizable(True, True)
-        self.minsize(800, 600)  # Minimum size for responsive layout
+        self.minsize(1000, 600)  # Minimum size for responsive layout
         
         # Store selected output folder
         self.output_folder = None
         
+        # Optional metrics hook (a cli.BatchMetrics or any callable) fed with every batch file's stage timings
+        self.metrics = None
+        
+        # Conversions run on a worker thread that only talks to the UI through this queue
+        self.progress_queue = queue.Queue()
+        self.job = None  # Counters of the running conversion, see _start_job
+        self._resume = threading.Event()  # Cleared while paused
+        self._cancel = threading.Event()
+        
+        # Previews render on their own worker thread, newest request first, see _preview_worker
+        self.preview_path = None
+        self.preview_cache = None  # cli.PreviewCache, created by the worker
+        self.preview_requests = queue.Queue()
+        self.preview_results = queue.Queue()
+        self.preview_generation = 0  # Number of the newest request
+        self.preview_photo = None  # The CTkImage on screen
+        self._preview_after = None
+        self._preview_thread = None
+        self._preview_polling = False
+        
         # Configure main grid
         self.grid_rowconfigure(0, weight=1)
         self.grid_columnconfigure(0, weight=1)
@@ -58,6 +89,7 @@ class ImageConverterApp(ctk.CTk):
         self.content_frame.grid(row=1, column=0, sticky="nsew")
         self.content_frame.grid_columnconfigure(0, weight=1)
         self.content_frame.grid_columnconfigure(1, weight=1)
+        self.content_frame.grid_columnconfigure(2, weight=1)
         self.content_frame.grid_rowconfigure(0, weight=1)
         
         # LEFT COLUMN
@@ -76,6 +108,7 @@ class ImageConverterApp(ctk.CTk):
         
         self.formats = ["PNG", "JPEG", "WEBP", "BMP", "ICO", "GIF", "TIFF"]
         self.format_var = ctk.StringVar(value=self.formats[0])
+        self.format_var.trace_add("write", self._schedule_preview)
         self.format_dropdown = ctk.CTkOptionMenu(
             self.left_frame,
             variable=self.format_var,
@@ -98,6 +131,7 @@ class ImageConverterApp(ctk.CTk):
         
         self.max_widths = ["No Resize", "640px", "800px", "1080px", "1920px"]
         self.resize_var = ctk.StringVar(value=self.max_widths[0])
+        self.resize_var.trace_add("write", self._schedule_preview)
         self.resize_dropdown = ctk.CTkOptionMenu(
             self.left_frame,
             variable=self.resize_var,
@@ -107,7 +141,17 @@ class ImageConverterApp(ctk.CTk):
             button_hover_color="#E68400",
             dropdown_font=("Segoe UI", 12)
         )
-        self.resize_dropdown.grid(row=3, column=0, sticky="ew", pady=(0, 25))
+        self.resize_dropdown.grid(row=3, column=0, sticky="ew", pady=(0, 10))
+        
+        self.fast_resize_var = ctk.BooleanVar(value=False)
+        self.fast_resize_switch = ctk.CTkSwitch(
+            self.left_frame,
+            text="Fast downscale (draft decode)",
+            variable=self.fast_resize_var,
+            font=("Segoe UI", 12),
+            progress_color="#FF9500"
+        )
+        self.fast_resize_switch.grid(row=4, column=0, sticky="w", pady=(0, 25))
         
         # Quality Section (Left)
         self.quality_label = ctk.CTkLabel(
@@ -116,11 +160,11 @@ class ImageConverterApp(ctk.CTk):
             font=("Segoe UI", 15, "bold"),
             text_color="#FF9500"
         )
-        self.quality_label.grid(row=4, column=0, pady=(0, 10), sticky="w")
+        self.quality_label.grid(row=5, column=0, pady=(0, 10), sticky="w")
         
         # Quality slider with value
         self.quality_slider_frame = ctk.CTkFrame(self.left_frame, fg_color="transparent")
-        self.quality_slider_frame.grid(row=5, column=0, sticky="ew", pady=(0, 10))
+        self.quality_slider_frame.grid(row=6, column=0, sticky="ew", pady=(0, 25))
         self.quality_slider_frame.grid_columnconfigure(0, weight=1)
         
         self.quality_slider = ctk.CTkSlider(
@@ -144,9 +188,32 @@ class ImageConverterApp(ctk.CTk):
         )
         self.quality_value_label.grid(row=0, column=1, padx=(10, 0))
         
+        # Encoder Profile Section (Left)
+        self.profile_label = ctk.CTkLabel(
+            self.left_frame,
+            text="🗜️ Encoder Profile",
+            font=("Segoe UI", 15, "bold"),
+            text_color="#00CC88"
+        )
+        self.profile_label.grid(row=7, column=0, pady=(0, 10), sticky="w")
+        
+        self.profiles = ["Default"] + [profile.title() for profile in ENCODER_PROFILE_NAMES]
+        self.profile_var = ctk.StringVar(value=self.profiles[0])
+        self.profile_var.trace_add("write", self._schedule_preview)
+        self.profile_dropdown = ctk.CTkOptionMenu(
+            self.left_frame,
+            variable=self.profile_var,
+            values=self.profiles,
+            font=("Segoe UI", 13),
+            button_color="#00CC88",
+            button_hover_color="#00AA66",
+            dropdown_font=("Segoe UI", 12)
+        )
+        self.profile_dropdown.grid(row=8, column=0, sticky="ew", pady=(0, 10))
+        
         # RIGHT COLUMN
         self.right_frame = ctk.CTkFrame(self.content_frame, fg_color="transparent")
-        self.right_frame.grid(row=0, column=1, sticky="nsew", padx=(15, 20))
+        self.right_frame.grid(row=0, column=1, sticky="nsew", padx=(15, 15))
         self.right_frame.grid_columnconfigure(0, weight=1)
         
         # Output Folder Section (Right)
@@ -212,7 +279,75 @@ class ImageConverterApp(ctk.CTk):
             hover_color="#0066B2",
             text_color="#FFFFFF"
         )
-        self.batch_btn.grid(row=5, column=0, sticky="ew", pady=(0, 25))
+        self.batch_btn.grid(row=5, column=0, sticky="ew", pady=(0, 10))
+        
+        self.recursive_var = ctk.BooleanVar(value=False)
+        self.recursive_switch = ctk.CTkSwitch(
+            self.right_frame,
+            text="Include subfolders",
+            variable=self.recursive_var,
+            font=("Segoe UI", 12),
+            progress_color="#0078D4"
+        )
+        self.recursive_switch.grid(row=6, column=0, sticky="w", pady=(0, 10))
+        
+        self.preflight_var = ctk.BooleanVar(value=False)
+        self.preflight_switch = ctk.CTkSwitch(
+            self.right_frame,
+            text="Preflight (pixel-weighted ETA)",
+            variable=self.preflight_var,
+            font=("Segoe UI", 12),
+            progress_color="#0078D4"
+        )
+        self.preflight_switch.grid(row=7, column=0, sticky="w", pady=(0, 25))
+        
+        # PREVIEW COLUMN
+        self.preview_frame = ctk.CTkFrame(self.content_frame, fg_color="transparent")
+        self.preview_frame.grid(row=0, column=2, sticky="nsew", padx=(15, 20))
+        self.preview_frame.grid_columnconfigure(0, weight=1)
+        
+        self.preview_label = ctk.CTkLabel(
+            self.preview_frame,
+            text="🔍 Preview",
+            font=("Segoe UI", 15, "bold"),
+            text_color="#00B4FF"
+        )
+        self.preview_label.grid(row=0, column=0, pady=(0, 10), sticky="w")
+        
+        self.preview_btn = ctk.CTkButton(
+            self.preview_frame,
+            text="Choose Preview Image",
+            command=self.select_preview_file,
+            font=("Segoe UI", 12, "bold"),
+            height=40,
+            corner_radius=8,
+            fg_color="#00B4FF",
+            hover_color="#0096D6",
+            text_color="#000000"
+        )
+        self.preview_btn.grid(row=1, column=0, sticky="ew", pady=(0, 12))
+        
+        self.preview_image_label = ctk.CTkLabel(
+            self.preview_frame,
+            text="No image selected",
+            width=PREVIEW_DISPLAY_SIZE,
+            height=PREVIEW_DISPLAY_SIZE,
+            font=("Segoe UI", 11),
+            text_color="#888888",
+            fg_color="#1E1E1E",
+            corner_radius=10
+        )
+        self.preview_image_label.grid(row=2, column=0, sticky="ew", pady=(0, 10))
+        
+        self.preview_info_label = ctk.CTkLabel(
+            self.preview_frame,
+            text="Shows the output size and bytes for the current settings",
+            font=("Segoe UI", 11),
+            text_color="#A0A0A0",
+            justify="left",
+            wraplength=PREVIEW_DISPLAY_SIZE
+        )
+        self.preview_info_label.grid(row=3, column=0, sticky="w")
         
         # ===== BOTTOM SECTION: Progress & Status =====
         self.bottom_frame = ctk.CTkFrame(self.main_frame, fg_color="transparent")
@@ -234,11 +369,42 @@ class ImageConverterApp(ctk.CTk):
             progress_color="#00B4FF"
         )
         self.progress_bar.set(0)
-        self.progress_bar.grid(row=1, column=0, sticky="ew", padx=(20, 20), pady=(0, 15))
+        self.progress_bar.grid(row=1, column=0, sticky="ew", padx=(20, 10), pady=(0, 15))
+        
+        # Pause / Cancel (enabled while a conversion runs)
+        self.pause_btn = ctk.CTkButton(
+            self.bottom_frame,
+            text="Pause",
+            command=self.toggle_pause,
+            font=("Segoe UI", 11, "bold"),
+            width=80,
+            height=28,
+            corner_radius=8,
+            fg_color="#FF9500",
+            hover_color="#E68400",
+            text_color="#000000",
+            state="disabled"
+        )
+        self.pause_btn.grid(row=1, column=1, padx=(0, 8), pady=(0, 15))
+        
+        self.cancel_btn = ctk.CTkButton(
+            self.bottom_frame,
+            text="Cancel",
+            command=self.cancel_conversion,
+            font=("Segoe UI", 11, "bold"),
+            width=80,
+            height=28,
+            corner_radius=8,
+            fg_color="#D32F2F",
+            hover_color="#B71C1C",
+            text_color="#FFFFFF",
+            state="disabled"
+        )
+        self.cancel_btn.grid(row=1, column=2, padx=(0, 20), pady=(0, 15))
         
         # Status Frame
         self.status_frame = ctk.CTkFrame(self.bottom_frame, fg_color="#1E1E1E", corner_radius=10)
-        self.status_frame.grid(row=2, column=0, sticky="ew", padx=(20, 20))
+        self.status_frame.grid(row=2, column=0, columnspan=3, sticky="ew", padx=(20, 20))
         
         self.status_label = ctk.CTkLabel(
             self.status_frame,
@@ -247,54 +413,39 @@ class ImageConverterApp(ctk.CTk):
             text_color="#A0A0A0"
         )
         self.status_label.pack(padx=15, pady=12)
+        
+        # Per-file errors, shown once the first one comes in
+        self.error_box = ctk.CTkTextbox(
+            self.bottom_frame,
+            height=80,
+            font=("Consolas", 11),
+            fg_color="#1E1E1E",
+            text_color="#FF6B6B",
+            corner_radius=10
+        )
+        
+        self.after_idle(self._preload_cli)
+
+    def _preload_cli(self):
+        """Import cli on a background thread once the window is up, so the first conversion does not wait for it."""
+        threading.Thread(target=importlib.import_module, args=("cli",), daemon=True).start()
 
     def convert_file(self):
         """Convert a single image file."""
         file_path = filedialog.askopenfilename(
             title="Select an Image",
-            filetypes=[("Image Files", "*.jpg *.jpeg *.png *.webp *.bmp *.ico *.gif *.tiff")]
+            filetypes=IMAGE_FILETYPES
         )
         
         if not file_path:
             return
 
-        target_format = self.format_var.get()
-        max_width = self._parse_max_width(self.resize_var.get())
-        quality = int(self.quality_slider.get())
-
-        try:
-            self.progress_bar.set(0.5)
-            with Image.open(file_path) as img:
-                # Resize if needed
-                if max_width:
-                    img = self._resize_image(img, max_width)
-                
-                # Handle transparency
-                if target_format.lower() in ['jpeg', 'jpg'] and img.mode in ('RGBA', 'P'):
-                    img = img.convert('RGB')
-                
-                # Determine output path
-                file_root, _ = os.path.splitext(file_path)
-                if self.output_folder:
-                    output_path = os.path.join(self.output_folder, os.path.basename(file_root) + f"_converted.{target_format.lower()}")
-                else:
-                    output_path = f"{file_root}_converted.{target_format.lower()}"
-                
-                # Save with quality for JPEG/WebP
-                save_kwargs = {}
-                if target_format.lower() in ['jpg', 'jpeg', 'webp']:
-                    save_kwargs['quality'] = min(100, max(1, int(quality)))  # Clamp quality to 1-100
-                
-                img.save(output_path, target_format.upper(), **save_kwargs)
-                self.progress_bar.set(1.0)
-                self.status_label.configure(text=f"✓ Converted: {os.path.basename(output_path)}")
-                messagebox.showinfo("Success", f"Image saved at:\n{output_path}")
-                self.progress_bar.set(0)
-            
-        except Exception as e:
-            self.progress_bar.set(0)
-            self.status_label.configure(text=f"✗ Error: {str(e)[:50]}")
-            messagebox.showerror("Error", f"Failed to convert:\n{e}")
+        settings = self._pipeline_settings()
+        
+        # Same worker as a batch, with one file and no process pool
+        self._start_job(f"⏳ Converting {os.path.basename(file_path)}...", single=True, preview_path=file_path)
+        self.progress_bar.set(0.5)
+        self._run_worker(functools.partial(iter, [file_path]), settings, workers=1)
 
     def batch_convert_folder(self):
         """Convert multiple images in a folder."""
@@ -303,101 +454,370 @@ class ImageConverterApp(ctk.CTk):
         if not folder_path:
             return
         
-        target_format = self.format_var.get()
-        max_width = self._parse_max_width(self.resize_var.get())
-        quality = int(self.quality_slider.get())
-        
-        folder = Path(folder_path)
-        image_extensions = {'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.ico', '.gif', '.tiff'}
-        image_files = [f for f in folder.glob("*") if f.suffix.lower() in image_extensions]
-        
-        if not image_files:
-            messagebox.showwarning("No Images", f"No image files found in:\n{folder_path}")
-            return
-        
-        self.status_label.configure(text=f"⏳ Converting {len(image_files)} images...")
-        self.batch_btn.configure(state="disabled")
-        self.single_btn.configure(state="disabled")
-        self.progress_bar.set(0)
+        recursive = self.recursive_var.get()
+        settings = self._pipeline_settings(source_root=folder_path if recursive else None)
         
+        # The worker counts (for the progress bar) and then streams a fresh scan, both off the UI thread
+        scan = functools.partial(self._scan_folder, folder_path, recursive, settings)
+        self._start_job("⏳ Scanning folder...", folder_path=folder_path)
+        self._run_worker(scan, settings, preflight=self.preflight_var.get())
+
+    def _scan_folder(self, folder_path, recursive, settings):
+        """Iterate the images in a folder, leaving out the output folder and earlier outputs (runs in a worker thread)."""
+        from cli import _exclude_output_folder, _skip_own_outputs, iter_image_files
+        exclude = _exclude_output_folder(folder_path, settings["output_folder"], recursive)
+        image_files = iter_image_files(folder_path, recursive=recursive, exclude=exclude)
+        return _skip_own_outputs(image_files, self._build_pipeline(settings))
+
+    def _pipeline_settings(self, source_root=None):
+        """Read the current settings as cli.ConversionPipeline arguments (on the UI thread, which owns the widgets)."""
+        return {
+            "output_format": self.format_var.get(),
+            "max_width": self._parse_max_width(self.resize_var.get()),
+            "quality": int(self.quality_slider.get()),
+            "output_folder": self.output_folder,
+            "resize_mode": self._resize_mode(),
+            "source_root": source_root,
+            "profile": self._encoder_profile()
+        }
+
+    @staticmethod
+    def _build_pipeline(settings):
+        """Build the cli.ConversionPipeline for `settings` (in a worker thread, so importing cli never blocks the UI)."""
+        from cli import ConversionPipeline
+        return ConversionPipeline(**settings)
+
+    def _run_worker(self, scan, settings, workers=None, preflight=False):
+        """Start _batch_convert_worker on a daemon thread and begin polling its progress."""
         batch_thread = threading.Thread(
             target=self._batch_convert_worker,
-            args=(image_files, target_format, folder_path, max_width, quality)
+            args=(scan, settings, workers, preflight)
         )
         batch_thread.daemon = True
         batch_thread.start()
+        self.after(PROGRESS_REFRESH_MS, self._poll_progress)
 
-    def _batch_convert_worker(self, image_files, target_format, folder_path, max_width=None, quality=85):
-        """Worker function for batch conversion (runs in separate thread)."""
-        success_count = 0
-        failed_count = 0
-        total = len(image_files)
-        
-        for idx, image_path in enumerate(image_files, 1):
-            try:
-                with Image.open(image_path) as img:
-                    # Resize if needed
-                    if max_width:
-                        img = self._resize_image(img, max_width)
-                    
-                    # Handle transparency
-                    if target_format.lower() in ['jpeg', 'jpg'] and img.mode in ('RGBA', 'P'):
-                        img = img.convert('RGB')
-                    
-                    # Determine output path
-                    file_root, _ = os.path.splitext(str(image_path))
-                    if self.output_folder:
-                        output_path = os.path.join(self.output_folder, os.path.basename(file_root) + f"_converted.{target_format.lower()}")
+    def _batch_convert_worker(self, scan, settings, workers=None, preflight=False):
+        """Worker function for conversions (runs in separate thread).
+        
+        Never touches a widget: everything goes through progress_queue as
+        ("total", n), ("result", result), ("progress", fraction done),
+        ("error", exception) and finally ("done", cancelled). `settings` are
+        the pipeline arguments read from the widgets, and `scan` returns a
+        fresh iterable of image paths. By default the files are counted and
+        then streamed, so the first conversion starts right after the count.
+        With preflight, every header is probed first: unreadable files fail at
+        once, big images go first and progress is weighted by pixels.
+        """
+        results = None
+        probe_index = None
+        try:
+            from cli import PixelProgress, ProbeIndex, count_image_files, iter_convert_images
+            pipeline = self._build_pipeline(settings)
+            if preflight:
+                probe_index = ProbeIndex()
+                progress = PixelProgress(probe_index, scan())
+                total = progress.files
+            else:
+                total = count_image_files(scan())
+            self.progress_queue.put(("total", total))
+            results = iter_convert_images(scan(), workers=workers, metrics=self.metrics, pipeline=pipeline,
+                                          probe_index=probe_index)
+            done = 0
+            for result in results if not self._cancel.is_set() else ():
+                done += 1
+                if probe_index is not None:
+                    progress.update(result)
+                self.progress_queue.put(("result", result))
+                self.progress_queue.put(("progress", progress.fraction if probe_index is not None else done / total))
+                # While paused no further results are pulled, so no new chunks are dispatched
+                self._resume.wait()
+                if self._cancel.is_set():
+                    break
+        except Exception as e:
+            self.progress_queue.put(("error", e))
+        finally:
+            if results is not None:
+                results.close()  # Cancels the chunks that have not started yet
+            if probe_index is not None:
+                probe_index.close()
+            self.progress_queue.put(("done", self._cancel.is_set()))
+
+    def _start_job(self, status_text, single=False, folder_path=None, preview_path=None):
+        """Reset the progress state and switch the controls to a running conversion."""
+        self.job = {"total": None, "done": 0, "fraction": 0.0, "converted": 0, "failed": 0, "errors": [],
+                    "shown_errors": 0, "single": single, "folder_path": folder_path, "output": None,
+                    "preview_path": preview_path, "started": time.perf_counter(), "paused_at": None,
+                    "paused_seconds": 0.0}
+        self._cancel.clear()
+        self._resume.set()
+        self.error_box.delete("1.0", "end")
+        self.error_box.grid_forget()
+        self.progress_bar.set(0)
+        self.status_label.configure(text=status_text)
+        self.batch_btn.configure(state="disabled")
+        self.single_btn.configure(state="disabled")
+        self.pause_btn.configure(state="normal", text="Pause")
+        self.cancel_btn.configure(state="normal")
+
+    def _poll_progress(self):
+        """Apply every queued worker event, then redraw once (runs on the UI thread via after())."""
+        job = self.job
+        cancelled = None
+        try:
+            while True:
+                kind, payload = self.progress_queue.get_nowait()
+                if kind == "total":
+                    job["total"] = payload
+                elif kind == "result":
+                    job["done"] += 1
+                    if payload["status"] == "failed":
+                        job["failed"] += 1
+                        job["errors"].append(f"✗ {os.path.basename(payload['input'])}: {payload['error']}")
                     else:
-                        output_path = f"{file_root}_converted.{target_format.lower()}"
-                    
-                    # Save with quality
-                    save_kwargs = {}
-                    if target_format.lower() in ['jpg', 'jpeg', 'webp']:
-                        save_kwargs['quality'] = min(100, max(1, int(quality)))  # Clamp quality to 1-100
-                    
-                    img.save(output_path, target_format.upper(), **save_kwargs)
-                    success_count += 1
-                    
-            except Exception:
-                failed_count += 1
-            
-            # Update progress bar
-            progress = idx / total
-            self.progress_bar.set(progress)
-        
-        message = f"Batch Conversion Complete!\n\n"
-        message += f"✓ Successful: {success_count}/{total}\n"
-        message += f"✗ Failed: {failed_count}/{total}\n"
-        message += f"\nFiles saved to:\n{self.output_folder if self.output_folder else folder_path}"
-        
-        self.status_label.configure(
-            text=f"✓ Batch complete: {success_count} successful, {failed_count} failed"
-        )
+                        job["converted"] += 1
+                        job["output"] = payload["output"]
+                elif kind == "progress":
+                    job["fraction"] = payload
+                elif kind == "error":
+                    job["errors"].append(f"✗ {payload}")
+                else:
+                    cancelled = payload
+        except queue.Empty:
+            pass
+        
+        if cancelled is None:
+            self._show_progress()
+            self.after(PROGRESS_REFRESH_MS, self._poll_progress)
+        else:
+            self._finish_job(cancelled)
+
+    def _show_progress(self):
+        """Draw the progress bar, throughput, ETA and any new per-file errors."""
+        job = self.job
+        if job["errors"][job["shown_errors"]:]:
+            self.error_box.grid(row=3, column=0, columnspan=3, sticky="ew", padx=(20, 20), pady=(10, 0))
+            self.error_box.insert("end", "".join(f"{line}\n" for line in job["errors"][job["shown_errors"]:]))
+            self.error_box.see("end")
+            job["shown_errors"] = len(job["errors"])
+        
+        total = job["total"]
+        if job["single"] or not total:
+            return
+        self.progress_bar.set(job["fraction"])
+        if self._cancel.is_set():
+            self.status_label.configure(text=f"⏹ Cancelling after {job['done']}/{total}...")
+            return
+        if job["paused_at"] is not None:
+            self.status_label.configure(text=f"⏸ Paused at {job['done']}/{total}")
+            return
+        
+        elapsed = time.perf_counter() - job["started"] - job["paused_seconds"]
+        rate = job["done"] / elapsed if elapsed > 0 else 0
+        # With preflight the fraction counts pixels: a folder of thumbnails with one panorama left is not almost done
+        remaining = elapsed * (1 - job["fraction"]) / job["fraction"] if job["fraction"] else None
+        eta = f" · ETA {self._format_seconds(remaining)}" if remaining is not None else ""
+        failed = f" · ✗ {job['failed']} failed" if job["failed"] else ""
+        self.status_label.configure(text=f"⏳ {job['done']}/{total} · {rate:.1f} img/s{eta}{failed}")
+
+    def _finish_job(self, cancelled):
+        """Show the outcome of a finished (or cancelled) conversion and re-enable the controls."""
+        job = self.job
+        self._show_progress()
         self.batch_btn.configure(state="normal")
         self.single_btn.configure(state="normal")
+        self.pause_btn.configure(state="disabled", text="Pause")
+        self.cancel_btn.configure(state="disabled")
+        
+        if job["single"]:
+            self.progress_bar.set(0)
+            if job["preview_path"]:
+                # Previewed only now, so a huge image is not decoded twice at once
+                self.preview_path = job["preview_path"]
+                self._schedule_preview()
+            if job["converted"]:
+                self.status_label.configure(text=f"✓ Converted: {os.path.basename(job['output'])}")
+                messagebox.showinfo("Success", f"Image saved at:\n{job['output']}")
+            elif cancelled:
+                self.status_label.configure(text="Cancelled")
+            else:
+                error = job["errors"][-1] if job["errors"] else "✗ Error: unknown"
+                self.status_label.configure(text=error[:60])
+                messagebox.showerror("Error", f"Failed to convert:\n{error}")
+            return
+        
+        if job["total"] == 0 and not job["errors"]:
+            self.status_label.configure(text="Ready to convert images")
+            messagebox.showwarning("No Images", f"No image files found in:\n{job['folder_path']}")
+            return
+        
+        total = job["total"] or job["done"]
+        elapsed = time.perf_counter() - job["started"] - job["paused_seconds"]
+        message = "Batch Conversion Cancelled\n\n" if cancelled else "Batch Conversion Complete!\n\n"
+        message += f"✓ Successful: {job['converted']}/{total}\n"
+        message += f"✗ Failed: {job['failed']}/{total}\n"
+        if cancelled:
+            message += f"⏹ Not converted: {total - job['done']}\n"
+        message += f"⏱ {self._format_seconds(elapsed)} ({job['done'] / elapsed if elapsed > 0 else 0:.1f} img/s)\n"
+        message += f"\nFiles saved to:\n{self.output_folder if self.output_folder else job['folder_path']}"
+        from cli import BatchMetrics
+        if isinstance(self.metrics, BatchMetrics):
+            message += f"\n\n⏱ {self.metrics.format_stages()}"
+        
+        state = "⏹ Batch cancelled" if cancelled else "✓ Batch complete"
+        self.status_label.configure(text=f"{state}: {job['converted']} successful, {job['failed']} failed")
         messagebox.showinfo("Batch Conversion", message)
 
+    def toggle_pause(self):
+        """Pause or resume the running conversion (chunks already in flight still finish)."""
+        job = self.job
+        if self._resume.is_set():
+            self._resume.clear()
+            job["paused_at"] = time.perf_counter()
+            self.pause_btn.configure(text="Resume")
+        else:
+            job["paused_seconds"] += time.perf_counter() - job["paused_at"]
+            job["paused_at"] = None
+            self._resume.set()
+            self.pause_btn.configure(text="Pause")
+
+    def cancel_conversion(self):
+        """Stop the running conversion after the files already being converted."""
+        self._cancel.set()
+        if not self._resume.is_set():
+            self.toggle_pause()  # Let a paused worker see the cancel
+        self.pause_btn.configure(state="disabled")
+        self.cancel_btn.configure(state="disabled")
+        self.status_label.configure(text="⏹ Cancelling...")  # Until the worker reports back
+
+    @staticmethod
+    def _format_seconds(seconds):
+        """Format a duration as m:ss (or h:mm:ss)."""
+        minutes, seconds = divmod(int(seconds), 60)
+        hours, minutes = divmod(minutes, 60)
+        return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
     def _parse_max_width(self, width_str):
         """Parse max width from dropdown string (e.g., '1920px' -> 1920)."""
         if width_str == "No Resize" or not width_str:
             return None
         return int(width_str.replace("px", ""))
 
-    def _resize_image(self, img, max_width):
-        """Resize image maintaining aspect ratio."""
-        if img.width <= max_width:
-            return img  # No resize needed if smaller than max_width
-        
-        # Calculate new height maintaining aspect ratio
-        ratio = max_width / img.width
-        new_height = int(img.height * ratio)
-        
-        return img.resize((max_width, new_height), Image.Resampling.LANCZOS)
-    
+    def _resize_mode(self):
+        """Return the cli resize mode selected by the fast downscale switch."""
+        return "fast" if self.fast_resize_var.get() else "exact"
+
+    def _encoder_profile(self):
+        """Return the cli encoder profile picked in the dropdown (None = Pillow's defaults)."""
+        profile = self.profile_var.get().lower()
+        return profile if profile in ENCODER_PROFILE_NAMES else None
+
     def _update_quality_label(self, value):
         """Update quality value display when slider changes."""
         self.quality_value_label.configure(text=str(int(float(value))))
+        self._schedule_preview()
+
+    def select_preview_file(self):
+        """Pick the image the preview pane shows."""
+        file_path = filedialog.askopenfilename(
+            title="Select an Image to Preview",
+            filetypes=IMAGE_FILETYPES
+        )
+        if file_path:
+            self.preview_path = file_path
+            self._schedule_preview()
+
+    def _schedule_preview(self, *args):
+        """Render the preview again once the settings have been left alone for a moment (also a variable trace)."""
+        if self.preview_path is None:
+            return
+        if self._preview_after is not None:
+            self.after_cancel(self._preview_after)
+        self._preview_after = self.after(PREVIEW_DELAY_MS, self._request_preview)
+
+    def _request_preview(self):
+        """Queue the current file and settings for the preview worker, starting it on first use."""
+        self._preview_after = None
+        self.preview_generation += 1
+        self.preview_requests.put((self.preview_generation, self.preview_path, self._pipeline_settings()))
+        if self._preview_thread is None:
+            self._preview_thread = threading.Thread(target=self._preview_worker)
+            self._preview_thread.daemon = True
+            self._preview_thread.start()
+        if not self._preview_polling:
+            self._preview_polling = True
+            self.after(PROGRESS_REFRESH_MS, self._poll_preview)
+
+    def _preview_worker(self):
+        """Render queued preview requests (runs in a separate thread for the app's lifetime).
+        
+        Never touches a widget: results go to preview_results as (generation,
+        preview dict or exception). Requests overtaken by a newer one are
+        dropped unrendered. Only the first preview of a file decodes it; the
+        cli.PreviewCache then re-encodes its small copy for every change of
+        format, width, quality or profile.
+        """
+        from cli import PreviewCache
+        self.preview_cache = PreviewCache()
+        while True:
+            request = self.preview_requests.get()
+            try:
+                while True:
+                    request = self.preview_requests.get_nowait()
+            except queue.Empty:
+                pass
+            generation, path, settings = request
+            try:
+                pipeline = self._build_pipeline(settings)
+                result = self.preview_cache.preview(path, pipeline)
+                if result["image"].mode not in ("RGB", "RGBA"):
+                    result["image"] = result["image"].convert("RGBA")  # What a Tk photo image can show
+                result.update(path=path, format=pipeline.targets[0][0].upper())
+            except Exception as e:
+                result = e
+            self.preview_results.put((generation, result))
+
+    def _poll_preview(self):
+        """Show the newest rendered preview, polling until the latest request is in (runs on the UI thread via after())."""
+        latest = None
+        try:
+            while True:
+                latest = self.preview_results.get_nowait()
+        except queue.Empty:
+            pass
+        if latest is not None:
+            self._show_preview(latest[1])
+        if latest is not None and latest[0] == self.preview_generation:
+            self._preview_polling = False
+        else:
+            self.after(PROGRESS_REFRESH_MS, self._poll_preview)
+
+    def _show_preview(self, preview):
+        """Draw a preview result: the encoded image, its dimensions and (estimated) bytes."""
+        if isinstance(preview, Exception):
+            self.preview_photo = None
+            self.preview_image_label.configure(image=None, text="No preview")
+            self.preview_info_label.configure(text=f"✗ {preview}")
+            return
+        
+        image = preview["image"]
+        scale = min(1, PREVIEW_DISPLAY_SIZE / max(image.size))
+        self.preview_photo = ctk.CTkImage(light_image=image, dark_image=image,
+                                          size=(max(1, round(image.width * scale)), max(1, round(image.height * scale))))
+        self.preview_image_label.configure(image=self.preview_photo, text="")
+        source_width, source_height = preview["source_size"]
+        width, height = preview["size"]
+        estimate = "" if preview["exact"] else "≈ "
+        self.preview_info_label.configure(
+            text=f"{os.path.basename(preview['path'])}\n"
+                 f"{source_width}×{source_height} px · {self._format_bytes(preview['source_bytes'])}\n"
+                 f"→ {preview['format']} {width}×{height} px · {estimate}{self._format_bytes(preview['bytes'])}"
+        )
+
+    @staticmethod
+    def _format_bytes(size):
+        """Format a byte count as KB or MB."""
+        return f"{size / (1 << 20):.1f} MB" if size >= 1 << 20 else f"{size / 1024:.0f} KB"
     
     def select_output_folder(self):
         """Select output folder for converted images."""